@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import Account
+from .models import Account, OutboxEmail
 
 # Register your models here.
 
 admin.site.register(Account)
+admin.site.register(OutboxEmail)
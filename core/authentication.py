@@ -0,0 +1,72 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    A size-bounded, least recently used cache of resolved accounts by id that expire after
+    AUTH_USER_CACHE_SECONDS. It lives in the process, so another worker only sees an account change
+    once its own entry expires.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        # Every request gets its own copy, so changes a view makes to request.user never leak into the cache
+        return copy.copy(user)
+
+    def set(self, key, user):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + settings.AUTH_USER_CACHE_SECONDS, copy.copy(user))
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves the account of a token from a short-lived cache instead of loading it
+    on every request. Entries are dropped when the account is saved or deleted in this process, so a
+    deactivated, demoted or deleted account loses its rights at once here and within
+    AUTH_USER_CACHE_SECONDS in other processes. Staff and active flags always come from the account,
+    never from the token claims.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import OUTBOX_BATCH_SIZE, send_outbox_batch
+
+
+class Command(BaseCommand):
+    help = 'Sends queued outbox emails in batches over one SMTP connection per batch, retrying failures later.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--watch', action='store_true', help='Keep polling the outbox instead of exiting.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --watch.')
+
+    def handle(self, *args, **options):
+        total_sent = 0
+        total_failed = 0
+        while True:
+            sent, failed = send_outbox_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'{sent} emails sent, {failed} failed.')
+            # Keep draining while emails go out. A batch without a single success means SMTP is down, so back off
+            if sent:
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} will be retried.'))
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 
@@ -56,3 +57,27 @@ class Account(AbstractBaseUser, PermissionsMixin):
 
     def __str__(self):
         return self.email
+
+
+class OutboxEmail(models.Model):
+    """
+    An email written in the same transaction as the change that triggers it and sent later by the
+    send_outbox_emails worker, so requests never wait on SMTP.
+    """
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, default='')
+    recipient = models.EmailField(max_length=60)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent_at', 'next_attempt_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.recipient}'
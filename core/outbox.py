@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_SECONDS = 30
+OUTBOX_MAX_RETRY_SECONDS = 6 * 60 * 60
+# A claimed email is left to its worker for this long, then another worker may pick it up again
+OUTBOX_LEASE_SECONDS = 5 * 60
+
+
+def enqueue_email(subject, body, recipient, from_email=None):
+    """
+    Queues an email for the outbox worker. Call it inside the transaction of the change the email is about,
+    so the email exists exactly when that change commits.
+    """
+    return OutboxEmail.objects.create(subject=subject, body=body, recipient=recipient,
+                                      from_email=from_email or settings.EMAIL_HOST_USER)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(OUTBOX_RETRY_SECONDS * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_SECONDS))
+
+
+def pending_emails():
+    return OutboxEmail.objects.filter(sent_at__isnull=True, attempts__lt=OUTBOX_MAX_ATTEMPTS,
+                                      next_attempt_at__lte=timezone.now())
+
+
+def claim_emails(batch_size):
+    """
+    Takes up to `batch_size` due emails for this worker by moving their next attempt past the lease, in a
+    short transaction of its own. An email whose worker dies is sent again once the lease runs out.
+    """
+    with transaction.atomic():
+        emails = pending_emails().order_by('next_attempt_at', 'id')
+        # Lets several workers share the outbox on databases that can skip rows locked by another one
+        if connection.features.has_select_for_update_skip_locked:
+            emails = emails.select_for_update(skip_locked=True)
+        emails = list(emails[:batch_size])
+        lease = timezone.now() + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            attempts=F('attempts') + 1, next_attempt_at=lease)
+    for email in emails:
+        email.attempts += 1
+        email.next_attempt_at = lease
+    return emails
+
+
+def send_outbox_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Sends up to `batch_size` due emails over one SMTP connection and returns how many were sent and how many
+    failed. A failed email is retried later with exponential backoff, up to OUTBOX_MAX_ATTEMPTS times.
+    No transaction is open while talking to SMTP, so a slow mail server never holds up database writes.
+    """
+    emails = claim_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent = []
+    failed = []
+    smtp = get_connection()
+    try:
+        smtp.open()
+    except Exception as exc:
+        failed = [(email, exc) for email in emails]
+    else:
+        try:
+            for email in emails:
+                try:
+                    smtp.send_messages([EmailMessage(email.subject, email.body, email.from_email or None,
+                                                     [email.recipient])])
+                except Exception as exc:
+                    failed.append((email, exc))
+                else:
+                    sent.append(email)
+        finally:
+            smtp.close()
+
+    now = timezone.now()
+    for email in sent:
+        email.sent_at = now
+        email.last_error = ''
+    for email, exc in failed:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+        email.last_error = str(exc)
+    OutboxEmail.objects.bulk_update(emails, ['sent_at', 'next_attempt_at', 'last_error'])
+    return len(sent), len(failed)
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .models import Account
+
+
+@receiver([post_save, post_delete], sender=Account)
+def drop_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
@@ -1,11 +1,15 @@
+from io import StringIO
+
 from django.core import mail
+from django.core.management import call_command
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from core.tokens import get_tokens_for_user
+from core.models import OutboxEmail
+from core.tokens import get_activation_token, get_tokens_for_user
 
 
 class RegisterIntegrationTests(APITestCase):
@@ -28,7 +32,9 @@ class RegisterIntegrationTests(APITestCase):
         user = self.user_model.objects.get(email=self.valid_data['email'])
         self.assertFalse(user.is_active)
 
-        # Check if an email was sent
+        # The email is queued with the account and goes out with the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_outbox_emails', stdout=StringIO())
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('Activate Your Account', mail.outbox[0].subject)
         self.assertIn('Please click the activation link', mail.outbox[0].body)
@@ -47,6 +53,7 @@ class RegisterIntegrationTests(APITestCase):
         self.assertEqual(response.status_code, 400)
         self.assertFalse(self.user_model.objects.filter(email=invalid_data['email']).exists())
         self.assertEqual(len(mail.outbox), 0)  # No email should be sent
+        self.assertFalse(OutboxEmail.objects.exists())
 
 
 class AccountIntegrationTests(APITestCase):
@@ -88,8 +95,8 @@ class ActivateUserIntegrationTests(APITestCase):
         self.user.is_active = False
         self.user.save()
 
-        self.tokens = get_tokens_for_user(self.user)
-        self.activate_url = reverse('activate-user', kwargs={'token': self.tokens['access']})
+        self.token = get_activation_token(self.user)
+        self.activate_url = reverse('activate-user', kwargs={'token': self.token})
 
     def test_user_activation_success(self):
         response = self.client.get(self.activate_url)
@@ -99,6 +106,14 @@ class ActivateUserIntegrationTests(APITestCase):
         self.assertTrue(self.user.is_active)
         self.assertEqual(response.data['message'], 'Account activated successfully!')
 
+    def test_activation_token_is_not_an_access_token(self):
+        self.user.is_active = True
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+        response = self.client.get(reverse('order-history'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     def test_user_activation_invalid_token(self):
         invalid_activate_url = reverse('activate-user', kwargs={'token': 'invalid_token'})
         response = self.client.get(invalid_activate_url)
@@ -199,6 +214,13 @@ class DeleteAccountIntegrationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(get_user_model().objects.filter(email=self.user.email).exists())
 
+    def test_deleted_account_token_stops_working(self):
+        self.client.force_authenticate(user=None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {get_tokens_for_user(self.user)["access"]}')
+
+        self.assertEqual(self.client.delete(self.url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.delete(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
     def test_delete_account_unauthenticated(self):
         # Log out the user to simulate an unauthenticated request
         self.client.force_authenticate(user=None)
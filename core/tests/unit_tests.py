@@ -1,13 +1,23 @@
 from rest_framework.test import APITestCase, APISimpleTestCase, APIRequestFactory
 from django.urls import reverse, resolve
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from rest_framework import status
 from unittest.mock import patch, PropertyMock
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.exceptions import ValidationError, AuthenticationFailed
-
-from core.models import Account
+from django.core import mail
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from datetime import timedelta
+from io import StringIO
+import time
+
+from core.authentication import CachedJWTAuthentication, user_cache
+from core.models import Account, OutboxEmail
+from core.outbox import OUTBOX_MAX_ATTEMPTS, claim_emails, enqueue_email, pending_emails, retry_delay, \
+    send_outbox_batch
 from core.tokens import *
 from core.views import *
 from core.serializers import RegisterAccountSerializer
@@ -71,6 +81,13 @@ class TokenTests(TestCase):
         # Assert that None is returned for an invalid token
         self.assertIsNone(user_id)
 
+    def test_activation_token_outlives_outbox_retries(self):
+        token = ActivationToken(get_activation_token(self.user))
+        retries = sum((retry_delay(attempts) for attempts in range(1, OUTBOX_MAX_ATTEMPTS)), timedelta())
+
+        self.assertEqual(token_decoder(str(token)), self.user.pk)
+        self.assertGreater(timedelta(seconds=token['exp'] - token['iat']), retries)
+
 
 class RegisterAccountSerializerTests(APITestCase):
 
@@ -162,19 +179,20 @@ class RegisterUserViewTests(APITestCase):
             'password2': 'strongpassword123',
         }
 
-    @patch('core.views.get_tokens_for_user')
-    @patch('core.views.send_mail')
-    def test_post_valid_data(self, mock_send_mail, mock_get_tokens_for_user):
-        mock_get_tokens_for_user.return_value = {'access': 'mocked_token'}
+    @patch('core.views.get_activation_token')
+    def test_post_valid_data(self, mock_get_activation_token):
+        mock_get_activation_token.return_value = 'mocked_token'
 
         response = self.client.post(self.url, data=self.valid_data)
 
         self.assertEqual(response.status_code, 201)
         self.assertTrue(self.user_model.objects.filter(email=self.valid_data['email']).exists())
 
-        mock_send_mail.assert_called_once()
-        mock_get_tokens_for_user.assert_called_once()
-        email_body = mock_send_mail.call_args[0][1]
+        mock_get_activation_token.assert_called_once()
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.recipient, self.valid_data['email'])
+        self.assertIsNone(email.sent_at)
+        email_body = email.body
         expected_host = response.wsgi_request.get_host()
         expected_link = f'http://{expected_host}/api/activate/mocked_token'
 
@@ -193,6 +211,132 @@ class RegisterUserViewTests(APITestCase):
         self.assertIn('password', response.data)
         self.assertFalse(self.user_model.objects.filter(email=invalid_data['email']).exists())
 
+    @patch('core.views.enqueue_email', side_effect=DatabaseError('outbox unavailable'))
+    def test_account_rolls_back_without_its_email(self, mock_enqueue_email):
+        with self.assertRaises(DatabaseError):
+            self.client.post(self.url, data=self.valid_data)
+        self.assertFalse(self.user_model.objects.filter(email=self.valid_data['email']).exists())
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.email = enqueue_email('Hello', 'Body', 'user@example.com')
+
+    def test_batch_sends_pending_emails(self):
+        enqueue_email('Second', 'Body', 'other@example.com')
+
+        self.assertEqual(send_outbox_batch(), (2, 0))
+        self.assertEqual([message.to for message in mail.outbox], [['user@example.com'], ['other@example.com']])
+        self.assertEqual(OutboxEmail.objects.filter(sent_at__isnull=True).count(), 0)
+        self.assertEqual(send_outbox_batch(), (0, 0))
+
+    def test_failed_email_is_retried_with_backoff(self):
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(send_outbox_batch(), (0, 1))
+
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.attempts, self.email.last_error), (1, 'down'))
+        self.assertGreater(self.email.next_attempt_at, timezone.now())
+        self.assertEqual(send_outbox_batch(), (0, 0))
+        self.assertLess(retry_delay(1), retry_delay(2))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_batch(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_emails_are_sent_outside_a_transaction_under_a_lease(self):
+        outer_blocks = len(connection.atomic_blocks)
+        during_send = []
+
+        def send_messages(messages):
+            during_send.append((len(connection.atomic_blocks), pending_emails().count(),
+                                OutboxEmail.objects.get().attempts))
+            return len(messages)
+
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send_messages):
+            self.assertEqual(send_outbox_batch(), (1, 0))
+        self.assertEqual(during_send, [(outer_blocks, 0, 1)])
+
+    def test_email_of_a_dead_worker_is_sent_after_the_lease(self):
+        self.assertEqual(claim_emails(10), [self.email])
+        self.assertEqual(send_outbox_batch(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_batch(), (1, 0))
+        self.assertEqual(OutboxEmail.objects.get().attempts, 2)
+
+    def test_gives_up_after_max_attempts(self):
+        OutboxEmail.objects.update(attempts=OUTBOX_MAX_ATTEMPTS)
+        self.assertEqual(send_outbox_batch(), (0, 0))
+
+    def test_send_outbox_emails_command(self):
+        output = StringIO()
+        call_command('send_outbox_emails', batch_size=1, stdout=output)
+        self.assertIn('Sent 1 emails', output.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = get_user_model().objects.create_user(email='user@example.com', password='password123',
+                                                        name='Test User')
+        self.token = get_tokens_for_user(self.user)['access']
+        self.authentication = CachedJWTAuthentication()
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        return self.authentication.authenticate(request)[0]
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user, self.user)
+
+    def test_save_and_delete_invalidate(self):
+        self.authenticate()
+        self.user.name = 'Renamed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().name, 'Renamed')
+
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_cache_expires_and_stays_bounded(self):
+        with override_settings(AUTH_USER_CACHE_SECONDS=0):
+            self.authenticate()
+            with self.assertNumQueries(1):
+                self.authenticate()
+
+        other = get_user_model().objects.create_user(email='other@example.com', password='password123', name='Other')
+        other_token = get_tokens_for_user(other)['access']
+        with override_settings(AUTH_USER_CACHE_SIZE=1):
+            self.authenticate()
+            self.authenticate(other_token)
+        self.assertEqual(len(user_cache.entries), 1)
+
+    def test_deactivation_and_demotion_take_effect(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(self.authenticate().is_staff)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.assertFalse(self.authenticate().is_staff)
+
+        # Another process changing the account is seen once the cached entry expires
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertTrue(self.authenticate().is_active)
+        with patch('core.authentication.time.monotonic', return_value=time.monotonic() + 31):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
 
 class ActivateUserViewTests(TestCase):
 
@@ -1,7 +1,7 @@
 import jwt
 
 from django.conf import settings
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 
 class CustomRefreshToken(RefreshToken):
@@ -12,6 +12,24 @@ class CustomRefreshToken(RefreshToken):
         return token
 
 
+class ActivationToken(AccessToken):
+    """
+    Carries the account id of an activation link. It lives for ACTIVATION_TOKEN_LIFETIME, long enough for the
+    outbox to retry the email, and its own token type keeps it from authenticating API requests.
+    """
+    token_type = 'activation'
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_exp(lifetime=settings.ACTIVATION_TOKEN_LIFETIME)
+        return token
+
+
+def get_activation_token(user):
+    return str(ActivationToken.for_user(user))
+
+
 def get_tokens_for_user(user):
     refresh = CustomRefreshToken.for_user(user)
     return {
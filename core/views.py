@@ -1,7 +1,6 @@
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -9,8 +8,9 @@ from django.shortcuts import get_object_or_404
 from django.http import Http404
 
 from .models import Account
+from .outbox import enqueue_email
 from .serializers import RegisterAccountSerializer, LoginAccountSerializer, LogoutUserSerializer
-from .tokens import get_tokens_for_user, token_decoder
+from .tokens import get_activation_token, token_decoder
 
 User = get_user_model()
 
@@ -20,19 +20,17 @@ class RegisterUserView(APIView):
         serializer = RegisterAccountSerializer(data=request.data)
 
         if serializer.is_valid():
-            user = serializer.save()
-            token = get_tokens_for_user(user)
-
-            current_site = request.get_host()
-            activation_link = f'http://{current_site}/api/activate/{token["access"]}'
-
-            send_mail(
-                'Activate Your Account',
-                f'Please click the activation link to activate your account: {activation_link}',
-                settings.EMAIL_HOST_USER,
-                [user.email],
-                fail_silently=False,
-            )
+            # The activation email is queued with the account and sent by the send_outbox_emails worker
+            with transaction.atomic():
+                user = serializer.save()
+                current_site = request.get_host()
+                activation_link = f'http://{current_site}/api/activate/{get_activation_token(user)}'
+
+                enqueue_email(
+                    'Activate Your Account',
+                    f'Please click the activation link to activate your account: {activation_link}',
+                    user.email,
+                )
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
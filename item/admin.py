@@ -1,9 +1,23 @@
 from django.contrib import admin
 
-from .models import Category, Item, Order
+from .models import Category, Item, Order, ArchivedOrder, DailySales, DailyCategorySales, DailyItemSales, \
+    AnalyticsSketch, CustomerActivity, CohortCell, AccountOrderSummary, ItemRecommendation, StockShard, StockMovement, \
+    StockSnapshot
 
 # Register your models here.
 
 admin.site.register(Category)
 admin.site.register(Item)
 admin.site.register(Order)
+admin.site.register(ArchivedOrder)
+admin.site.register(DailySales)
+admin.site.register(DailyCategorySales)
+admin.site.register(DailyItemSales)
+admin.site.register(AnalyticsSketch)
+admin.site.register(CustomerActivity)
+admin.site.register(CohortCell)
+admin.site.register(AccountOrderSummary)
+admin.site.register(ItemRecommendation)
+admin.site.register(StockShard)
+admin.site.register(StockMovement)
+admin.site.register(StockSnapshot)
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+from .signals import archiving_orders
+
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVED_FIELDS = ['id', 'item_id', 'user_id', 'account_id', 'total_price', 'quantity', 'order_date', 'item_name',
+                   'unit_price']
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_order_batches(before, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Moves orders placed before `before` into ArchivedOrder, oldest first, and yields the size of every batch.
+    Each batch is copied and deleted in one transaction, so an interrupted run can simply be started again.
+    """
+    while True:
+        with transaction.atomic():
+            rows = list(Order.objects.filter(order_date__lt=before).order_by('order_date', 'id')
+                        .values(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                return
+            ArchivedOrder.objects.bulk_create(ArchivedOrder(**row) for row in rows)
+            token = archiving_orders.set(True)
+            try:
+                Order.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+            finally:
+                archiving_orders.reset(token)
+        yield len(rows)
+
+
+class TieredOrders:
+    """
+    Reads hot and archived orders as one sequence ordered newest first. Orders are archived oldest first,
+    so every archived order is older than every hot one and the archive is only read once the hot rows
+    run out. Supports the filter, order_by and slicing that order history and its pagination use.
+    """
+
+    def __init__(self, hot, archived):
+        self.hot = hot
+        self.archived = archived
+
+    def filter(self, *args, **kwargs):
+        return TieredOrders(self.hot.filter(*args, **kwargs), self.archived.filter(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return TieredOrders(self.hot.order_by(*fields), self.archived.order_by(*fields))
+
+    def count(self):
+        return self.hot.count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        yield from self.hot
+        yield from self.archived
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('TieredOrders only supports slices without a step.')
+        start = key.start or 0
+        if key.stop is None:
+            return list(self)[start:]
+
+        rows = list(self.hot[start:key.stop])
+        missing = key.stop - start - len(rows)
+        if missing > 0:
+            hot_count = start + len(rows) if rows else self.hot.count()
+            skip = max(start - hot_count, 0)
+            rows += list(self.archived[skip:skip + missing])
+        return rows
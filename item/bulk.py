@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .ledger import record_movements
+from .models import Item, Category, StockMovement
+from .serializers import ItemBulkRowSerializer
+from .signals import catalog_changed
+from .stock import available_stock, set_stock
+
+BULK_CHUNK_SIZE = getattr(settings, 'ITEM_BULK_CHUNK_SIZE', 500)
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate_item_rows(rows):
+    """
+    Validates all rows in one pass. Returns the valid rows as (index, validated_data) pairs, the existing
+    items referenced by updates and a list of per-row errors.
+    """
+    serializer = ItemBulkRowSerializer(partial=True)
+    valid = []
+    errors = []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, serializer.run_validation(row)))
+        except ValidationError as exc:
+            errors.append({'index': index, 'errors': exc.detail})
+
+    category_ids = {data['category'] for _, data in valid if 'category' in data}
+    known_categories = set(Category.objects.filter(pk__in=category_ids).values_list('pk', flat=True))
+    existing = Item.objects.in_bulk([data['id'] for _, data in valid if 'id' in data])
+
+    checked = []
+    for index, data in valid:
+        if 'category' in data and data['category'] not in known_categories:
+            errors.append({'index': index, 'errors': {'category': [f'Category {data["category"]} does not exist.']}})
+        elif 'id' in data and data['id'] not in existing:
+            errors.append({'index': index, 'errors': {'id': [f'Item {data["id"]} does not exist.']}})
+        else:
+            checked.append((index, data))
+
+    errors.sort(key=lambda error: error['index'])
+    return checked, existing, errors
+
+
+def bulk_upsert_items(rows, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Creates and updates items from a list of row dicts with bulk_create/bulk_update, one transaction per
+    chunk. Updates only write the columns their rows set. Invalid rows are skipped and reported,
+    `catalog_changed` is sent once for the whole batch.
+    """
+    valid, _, errors = validate_item_rows(rows)
+    created = []
+    updated = []
+
+    for chunk in chunked(valid, chunk_size):
+        with transaction.atomic():
+            # Items are re-read and locked here, so every row writes only its own fields over current values
+            items = Item.objects.select_for_update().in_bulk([data['id'] for _, data in chunk if 'id' in data])
+            to_create = []
+            changed = {}
+            # Rows for the same item apply in order, so each one moves the stock from where the previous left it
+            stock = {}
+            movements = []
+            for index, data in chunk:
+                data = dict(data)
+                if 'category' in data:
+                    data['category_id'] = data.pop('category')
+                if 'id' not in data:
+                    to_create.append(Item(**data))
+                    continue
+
+                item = items.get(data.pop('id'))
+                if item is None:
+                    errors.append({'index': index, 'errors': {'id': ['Item was deleted during the upload.']}})
+                    continue
+                if 'quantity' in data:
+                    if item.pk not in stock:
+                        stock[item.pk] = available_stock(item, for_update=True)
+                    movements.append((item.pk, data['quantity'] - stock[item.pk], StockMovement.BULK_UPDATE))
+                    stock[item.pk] = data['quantity']
+                    if item.stock_shard_count:
+                        data.pop('quantity')
+                for field, value in data.items():
+                    setattr(item, field, value)
+                changed.setdefault(item.pk, set()).update(data)
+
+            if to_create:
+                Item.objects.bulk_create(to_create)
+            by_fields = {}
+            for pk, fields in changed.items():
+                if fields:
+                    by_fields.setdefault(tuple(sorted(fields)), []).append(items[pk])
+            for fields, group in by_fields.items():
+                Item.objects.bulk_update(group, fields)
+            for pk, quantity in stock.items():
+                if items[pk].stock_shard_count:
+                    set_stock(items[pk], quantity)
+            movements.extend((item.pk, item.quantity, StockMovement.BULK_UPDATE) for item in to_create)
+            record_movements(movements)
+        created.extend(to_create)
+        updated.extend(items[pk] for pk in changed)
+
+    errors.sort(key=lambda error: error['index'])
+    item_ids = [item.pk for item in created + updated]
+    if item_ids:
+        catalog_changed.send(sender=Item, item_ids=item_ids)
+
+    return created, updated, errors
@@ -0,0 +1,146 @@
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ArchivedOrder, CohortCell, CustomerActivity, Order
+from .rollups import lock_for_rebuild
+
+RETENTION_MONTHS = 12
+
+
+def month_number(day):
+    return day.year * 12 + day.month - 1
+
+
+def month_start(number):
+    return date(number // 12, number % 12 + 1, 1)
+
+
+def active_months(activity):
+    """
+    Month numbers in which the customer ordered, decoded from the activity bitmap.
+    """
+    bits = int.from_bytes(activity.months, 'little')
+    first = month_number(activity.first_month)
+    return {first + offset for offset in range(bits.bit_length()) if bits >> offset & 1}
+
+
+def set_active_months(activity, months):
+    first = min(months)
+    bits = sum(1 << (month - first) for month in months)
+    activity.first_month = month_start(first)
+    activity.months = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def cells(months):
+    """
+    The (cohort, offset) retention cells a customer active in `months` counts towards.
+    """
+    if not months:
+        return set()
+    first = min(months)
+    return {(month_start(first), month - first) for month in months}
+
+
+def add_to_cell(cohort, offset, customers):
+    if CohortCell.objects.filter(cohort=cohort, offset=offset).update(customers=F('customers') + customers):
+        return
+    try:
+        with transaction.atomic():
+            CohortCell.objects.create(cohort=cohort, offset=offset, customers=customers)
+    except IntegrityError:
+        CohortCell.objects.filter(cohort=cohort, offset=offset).update(customers=F('customers') + customers)
+
+
+def record_activity(orders):
+    """
+    Marks the months of `orders` in their customers' activity bitmaps and moves the retention counts along.
+    An order older than the customer's first one moves the customer to an earlier cohort.
+    """
+    from .orders import ANONYMOUS_EMAIL
+
+    months_by_account = {}
+    for order in orders:
+        if order.user_id != ANONYMOUS_EMAIL:
+            months_by_account.setdefault(order.user.pk, set()).add(
+                month_number(timezone.localdate(order.order_date)))
+
+    with transaction.atomic():
+        for account_id in sorted(months_by_account):
+            activity, _ = CustomerActivity.objects.select_for_update().get_or_create(
+                account_id=account_id, defaults={'first_month': month_start(min(months_by_account[account_id]))})
+            old_months = active_months(activity)
+            new_months = old_months | months_by_account[account_id]
+            if new_months == old_months:
+                continue
+
+            set_active_months(activity, new_months)
+            activity.save()
+            old_cells, new_cells = cells(old_months), cells(new_months)
+            for cohort, offset in old_cells - new_cells:
+                add_to_cell(cohort, offset, -1)
+            for cohort, offset in new_cells - old_cells:
+                add_to_cell(cohort, offset, 1)
+
+
+def rebuild_cohorts():
+    """
+    Recomputes every activity bitmap and retention cell from the hot and archived orders.
+    Returns the number of customers.
+    """
+    from .orders import ANONYMOUS_EMAIL
+
+    with transaction.atomic():
+        lock_for_rebuild(CustomerActivity, CohortCell)
+        months_by_account = {}
+        for orders in (Order.objects.all(), ArchivedOrder.objects.all()):
+            rows = orders.exclude(user_id=ANONYMOUS_EMAIL).annotate(month=TruncMonth('order_date')).values_list(
+                'user__pk', 'month').distinct()
+            for account_id, month in rows.iterator():
+                months_by_account.setdefault(account_id, set()).add(month_number(month))
+
+        counts = {}
+        activities = []
+        for account_id, months in months_by_account.items():
+            activity = CustomerActivity(account_id=account_id)
+            set_active_months(activity, months)
+            activities.append(activity)
+            for cell in cells(months):
+                counts[cell] = counts.get(cell, 0) + 1
+
+        CustomerActivity.objects.all().delete()
+        CohortCell.objects.all().delete()
+        CustomerActivity.objects.bulk_create(activities, batch_size=1000)
+        CohortCell.objects.bulk_create(
+            (CohortCell(cohort=cohort, offset=offset, customers=customers)
+             for (cohort, offset), customers in counts.items()),
+            batch_size=1000,
+        )
+    return len(activities)
+
+
+def retention_matrix(since=None, months=RETENTION_MONTHS):
+    """
+    For every cohort, the customers whose first order was in that month and how many of them ordered again
+    0..`months` months later, as counts and as a share of the cohort.
+    """
+    rows = CohortCell.objects.filter(offset__lte=months)
+    if since:
+        rows = rows.filter(cohort__gte=since)
+
+    matrix = {}
+    for cohort, offset, customers in rows.order_by('cohort', 'offset').values_list('cohort', 'offset', 'customers'):
+        matrix.setdefault(cohort, [0] * (months + 1))[offset] = customers
+
+    return [
+        {
+            'month': cohort.strftime('%Y-%m'),
+            'customers': counts[0],
+            'counts': counts,
+            'retention': [round(count / counts[0], 4) if counts[0] else 0 for count in counts],
+        }
+        for cohort, counts in matrix.items()
+    ]
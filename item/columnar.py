@@ -0,0 +1,202 @@
+import json
+import os
+import shutil
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+
+SNAPSHOT_CHUNK_SIZE = 10000
+MANIFEST = 'manifest.json'
+COLUMNS = {
+    'id': 'int64',
+    'order_date': 'datetime64[s]',
+    'customer': 'int64',
+    'item_id': 'int64',
+    'category_id': 'int64',
+    'quantity': 'int32',
+    'total_price': 'float64',
+    'unit_price': 'float64',
+}
+SOURCE_FIELDS = ['id', 'order_date', 'user__pk', 'item_id', 'item__category', 'quantity', 'total_price', 'unit_price']
+
+
+def snapshot_dir(directory=None):
+    return directory or getattr(settings, 'ORDER_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'analytics'))
+
+
+def read_manifest(directory=None):
+    path = os.path.join(snapshot_dir(directory), MANIFEST)
+    if not os.path.exists(path):
+        return {'segments': [], 'rows': 0, 'last_order_id': 0, 'updated_at': None}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(directory, manifest):
+    # Readers only ever see a complete manifest, and segments it doesn't list are ignored
+    path = os.path.join(directory, MANIFEST)
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(manifest, file)
+    os.replace(f'{path}.tmp', path)
+
+
+def order_batches(last_id, upper_id, batch_size=SNAPSHOT_CHUNK_SIZE):
+    """
+    Yields the orders with ids in (`last_id`, `upper_id`], hot and archived, in id ranges of `batch_size`,
+    each read on its own. The anonymous checkout account is not a customer and is left out. Hot orders are
+    read before archived ones, so an order archived in between is seen at least once, and duplicates are
+    dropped.
+    """
+    from .orders import ANONYMOUS_EMAIL
+
+    start = last_id
+    while start < upper_id:
+        end = min(start + batch_size, upper_id)
+        rows = {}
+        for orders in (Order.objects, ArchivedOrder.objects):
+            batch = orders.filter(id__gt=start, id__lte=end).exclude(user_id=ANONYMOUS_EMAIL)
+            rows.update((row[0], row) for row in batch.values_list(*SOURCE_FIELDS))
+        yield [rows[order_id] for order_id in sorted(rows)]
+        start = end
+
+
+def column_arrays(rows):
+    ids, dates, customers, items, categories, quantities, totals, prices = zip(*rows)
+    return {
+        'id': np.array(ids, dtype=COLUMNS['id']),
+        'order_date': np.array([int(date.timestamp()) for date in dates]).astype(COLUMNS['order_date']),
+        'customer': np.array(customers, dtype=COLUMNS['customer']),
+        'item_id': np.array(items, dtype=COLUMNS['item_id']),
+        'category_id': np.array(categories, dtype=COLUMNS['category_id']),
+        'quantity': np.array(quantities, dtype=COLUMNS['quantity']),
+        'total_price': np.array(totals, dtype=float),
+        'unit_price': np.array([np.nan if price is None else price for price in prices], dtype=float),
+    }
+
+
+def write_segment(directory, name, batches):
+    """
+    Writes the rows of `batches` into one .npy file per column under `directory/name` and returns how many
+    were written. Nothing is written when there are no rows.
+    """
+    parts = [column_arrays(rows) for rows in batches if rows]
+    if not parts:
+        return 0
+    # A run that died before updating the manifest may have left a partial segment behind
+    shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    os.makedirs(os.path.join(directory, name))
+    for column in COLUMNS:
+        np.save(os.path.join(directory, name, f'{column}.npy'), np.concatenate([part[column] for part in parts]))
+    return sum(len(part['id']) for part in parts)
+
+
+def append_snapshot(directory=None):
+    """
+    Appends the orders placed since the last run, hot and archived, as a new segment of the snapshot.
+    Orders are read in short id-ranged batches and the files are written outside any transaction.
+    Returns the number of rows added.
+    """
+    directory = snapshot_dir(directory)
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    last_id = manifest['last_order_id']
+    upper_id = max(orders.aggregate(last=Max('id'))['last'] or 0 for orders in (Order.objects, ArchivedOrder.objects))
+    if upper_id <= last_id:
+        return 0
+
+    name = f'segment-{len(manifest["segments"]) + 1:05d}-{last_id}'
+    written = write_segment(directory, name, order_batches(last_id, upper_id))
+    if written:
+        manifest['segments'].append(name)
+        manifest['rows'] += written
+    manifest['last_order_id'] = upper_id
+    manifest['updated_at'] = timezone.now().isoformat()
+    write_manifest(directory, manifest)
+    return written
+
+
+def compact_snapshot(directory=None):
+    """
+    Rewrites all segments into one, so readers can memory-map every column without concatenating.
+    """
+    directory = snapshot_dir(directory)
+    manifest = read_manifest(directory)
+    if len(manifest['segments']) < 2:
+        return manifest
+
+    columns = load_columns(directory)
+    name = f'segment-{len(manifest["segments"]) + 1:05d}-compacted'
+    os.makedirs(os.path.join(directory, name))
+    for column, values in columns.items():
+        np.save(os.path.join(directory, name, f'{column}.npy'), values)
+
+    old_segments = manifest['segments']
+    manifest['segments'] = [name]
+    write_manifest(directory, manifest)
+    for segment in old_segments:
+        shutil.rmtree(os.path.join(directory, segment), ignore_errors=True)
+    return manifest
+
+
+def load_columns(directory=None, columns=None):
+    """
+    Memory-maps the snapshot. A single segment is returned without copying; several are concatenated.
+    """
+    directory = snapshot_dir(directory)
+    segments = read_manifest(directory)['segments']
+    loaded = {}
+    for column in columns or COLUMNS:
+        parts = [np.load(os.path.join(directory, segment, f'{column}.npy'), mmap_mode='r') for segment in segments]
+        if not parts:
+            loaded[column] = np.empty(0, dtype=COLUMNS[column])
+        else:
+            loaded[column] = parts[0] if len(parts) == 1 else np.concatenate(parts)
+    return loaded
+
+
+def percentiles(values, points=(10, 25, 50, 75, 90, 99)):
+    if not len(values):
+        return {}
+    return {f'p{point}': round(float(value), 2) for point, value in zip(points, np.percentile(values, points))}
+
+
+def order_analytics(columns, bins=20):
+    """
+    Price distribution, basket sizes, per-customer spend and monthly cohorts, all computed on whole columns.
+    A basket is every order line a customer placed within the same second.
+    """
+    prices = columns['unit_price'][~np.isnan(columns['unit_price'])]
+    counts, edges = np.histogram(prices, bins=bins) if len(prices) else (np.array([], dtype=int), np.array([]))
+
+    customers, customer_index = np.unique(columns['customer'], return_inverse=True)
+    seconds = columns['order_date'].astype('int64')
+    _, basket_lines = np.unique(np.stack([columns['customer'], seconds], axis=1), axis=0, return_counts=True)
+    spend = np.bincount(customer_index, weights=columns['total_price'], minlength=len(customers))
+
+    months = columns['order_date'].astype('datetime64[M]')
+    first_month = np.full(len(customers), np.datetime64('9999-12', 'M'))
+    np.minimum.at(first_month, customer_index, months)
+    cohort_months, cohort_index, cohort_sizes = np.unique(first_month, return_inverse=True, return_counts=True)
+    cohort_revenue = np.bincount(cohort_index, weights=spend, minlength=len(cohort_months))
+    cohort_orders = np.bincount(cohort_index[customer_index], minlength=len(cohort_months))
+
+    return {
+        'orders': int(len(columns['id'])),
+        'customers': int(len(customers)),
+        'unit_price': {
+            'percentiles': percentiles(prices),
+            'histogram': {'edges': edges.round(2).tolist(), 'counts': counts.tolist()},
+        },
+        'units_per_order': percentiles(columns['quantity']),
+        'lines_per_basket': percentiles(basket_lines),
+        'spend_per_customer': {'mean': round(float(spend.mean()), 2) if len(spend) else 0,
+                               **percentiles(spend)},
+        'cohorts': [
+            {'month': str(month), 'customers': int(size), 'orders': int(orders), 'revenue': round(float(revenue), 2)}
+            for month, size, orders, revenue in zip(cohort_months, cohort_sizes, cohort_orders, cohort_revenue)
+        ],
+    }
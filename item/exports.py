@@ -0,0 +1,46 @@
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+class Echo:
+    """
+    File-like object for csv.writer that hands the formatted line back instead of buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def chunked_lines(lines, chunk_size):
+    """
+    Joins lines into chunks of `chunk_size`. The first line goes out on its own, so the client gets bytes
+    as soon as the first row is read instead of after a whole chunk.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    yield first
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def csv_stream(rows, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    yield from chunked_lines((writer.writerow([row[field] for field in fields]) for row in rows), chunk_size)
+
+
+def ndjson_stream(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    encoder = DjangoJSONEncoder()
+    yield from chunked_lines((encoder.encode(row) + '\n' for row in rows), chunk_size)
@@ -0,0 +1,129 @@
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from core.tokens import token_decoder
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_WAIT = getattr(settings, 'IDEMPOTENCY_WAIT', 10)
+# A claim still without a response after this long belongs to a request that died, and may be taken over
+IDEMPOTENCY_LEASE = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE', 60))
+POLL_INTERVAL = 0.05
+
+
+def request_scope(request):
+    """
+    Keys are only unique per endpoint and caller, so two customers picking the same key don't collide.
+    Anonymous callers are told apart by their address and user agent.
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if authorization.startswith('Bearer '):
+        # Scope by user, not by token, so a retry made after refreshing the access token still matches
+        caller = token_decoder(authorization[len('Bearer '):]) or authorization
+    else:
+        caller = f'anonymous|{request.META.get("REMOTE_ADDR", "")}|{request.META.get("HTTP_USER_AGENT", "")}'
+    return hashlib.sha256(f'{request.path}|{caller}'.encode()).hexdigest()
+
+
+def request_fingerprint(request):
+    body = request.body
+    # Multipart boundaries are random per request, so a retry of the same form must not differ by them
+    boundary = request.content_params.get('boundary')
+    if boundary:
+        body = body.replace(boundary.encode(), b'')
+    return hashlib.sha256(body).hexdigest()
+
+
+def claim(key, scope, request_hash=''):
+    """
+    Inserts the key before the request runs. The unique constraint lets only one of several concurrent
+    duplicates in, the rest get the existing record back. Expired keys and claims left without a response
+    for longer than IDEMPOTENCY_LEASE are taken over.
+    """
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(key=key, scope=scope, request_hash=request_hash), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(key=key, scope=scope).first()
+            if record is None:
+                continue
+            now = timezone.now()
+            expired = record.created_at < now - IDEMPOTENCY_KEY_TTL
+            abandoned = record.status_code is None and record.created_at < now - IDEMPOTENCY_LEASE
+            if not expired and not abandoned:
+                return record, False
+            # Only the request that actually removes the stale record retries, so just one takes it over
+            if not IdempotencyKey.objects.filter(pk=record.pk, status_code=record.status_code).delete()[0]:
+                return IdempotencyKey.objects.filter(key=key, scope=scope).first(), False
+    return None, False
+
+
+def wait_for_response(record):
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def idempotent(view):
+    """
+    Makes a POST view honour the Idempotency-Key header: the first response for a key is stored and
+    replayed unchanged for retries within IDEMPOTENCY_KEY_TTL, without running the view again. Reusing a key
+    with a different request body is answered with 422.
+    """
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+        if request.method != 'POST' or not key:
+            return view(request, *args, **kwargs)
+        if len(key) > 255:
+            return JsonResponse({'message': 'Idempotency-Key is too long.'}, status=400)
+
+        request_hash = request_fingerprint(request)
+        record, created = claim(key, request_scope(request), request_hash)
+        if not created:
+            if record is not None and record.request_hash and record.request_hash != request_hash:
+                return JsonResponse({'message': 'Idempotency-Key was already used for a different request.'},
+                                    status=422)
+            record = wait_for_response(record)
+            if record is None or record.status_code is None:
+                return JsonResponse({'message': 'A request with this Idempotency-Key is still in progress.'},
+                                    status=409)
+            response = HttpResponse(bytes(record.content), status=record.status_code,
+                                    content_type=record.content_type)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        except Exception:
+            record.delete()
+            raise
+
+        if response.status_code >= 500:
+            # Server errors are not the answer to the request, let the client retry it for real
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.content = response.content
+            record.content_type = response.get('Content-Type', '')
+            record.save(update_fields=['status_code', 'content', 'content_type'])
+        return response
+
+    return wrapped
+
+
+def purge_expired_keys():
+    return IdempotencyKey.objects.filter(created_at__lt=timezone.now() - IDEMPOTENCY_KEY_TTL).delete()[0]
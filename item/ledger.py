@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import StockMovement, StockSnapshot
+
+
+def record_movements(movements):
+    """
+    Appends (item_id, delta, reason) tuples to the ledger, skipping zero changes.
+    """
+    return StockMovement.objects.bulk_create(
+        StockMovement(item_id=item_id, delta=delta, reason=reason)
+        for item_id, delta, reason in movements if delta
+    )
+
+
+def record_movement(item_id, delta, reason):
+    return record_movements([(item_id, delta, reason)])
+
+
+def latest_snapshot(item_id, when=None):
+    snapshots = StockSnapshot.objects.filter(item_id=item_id)
+    if when is not None:
+        snapshots = snapshots.filter(as_of__lte=when)
+    return snapshots.order_by('-last_movement_id').first()
+
+
+def stock_as_of(item_id, when=None):
+    """
+    Replays the ledger: the newest snapshot taken before `when` plus the movements recorded after it.
+    Without `when` this is the current stock.
+    """
+    snapshot = latest_snapshot(item_id, when)
+    movements = StockMovement.objects.filter(item_id=item_id)
+    if snapshot:
+        movements = movements.filter(pk__gt=snapshot.last_movement_id)
+    if when is not None:
+        movements = movements.filter(created_at__lte=when)
+    return (snapshot.quantity if snapshot else 0) + (movements.aggregate(total=Sum('delta'))['total'] or 0)
+
+
+def compact_ledger(older_than=timedelta(hours=1), prune=False):
+    """
+    Folds every movement older than `older_than` into one new snapshot per item, so replays only read
+    recent movements. With `prune` the folded movements are deleted, which keeps stock_as_of exact only
+    at snapshot boundaries for the pruned period.
+    """
+    cutoff_id = StockMovement.objects.filter(
+        created_at__lt=timezone.now() - older_than
+    ).aggregate(last=Max('pk'))['last']
+    if cutoff_id is None:
+        return 0
+
+    previous = StockSnapshot.objects.filter(item=OuterRef('item')).order_by('-last_movement_id')
+    segments = StockMovement.objects.filter(pk__lte=cutoff_id).annotate(
+        folded_up_to=Coalesce(Subquery(previous.values('last_movement_id')[:1]), 0),
+        base_quantity=Coalesce(Subquery(previous.values('quantity')[:1]), 0),
+    ).filter(pk__gt=F('folded_up_to')).values('item', 'base_quantity').annotate(
+        delta=Sum('delta'), last_movement_id=Max('pk'), as_of=Max('created_at'),
+    )
+
+    with transaction.atomic():
+        snapshots = StockSnapshot.objects.bulk_create(
+            StockSnapshot(item_id=segment['item'], quantity=segment['base_quantity'] + segment['delta'],
+                          as_of=segment['as_of'], last_movement_id=segment['last_movement_id'])
+            for segment in segments
+        )
+        if prune:
+            StockMovement.objects.filter(pk__lte=cutoff_id).delete()
+    return len(snapshots)
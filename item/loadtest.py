@@ -0,0 +1,119 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.db import connection
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+
+from .models import Item, Order
+
+
+def weighted_plan(item_ids, requests, skew, quantities, seed=None):
+    """
+    Draws (item_id, quantity) purchases. Item popularity follows a Zipf-like curve: with skew 0 every
+    item is equally likely, higher values concentrate the traffic on the first items.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, len(item_ids) + 1)]
+    picks = rng.choices(item_ids, weights=weights, k=requests)
+    return [(item_id, rng.randint(*quantities)) for item_id in picks]
+
+
+def stock_levels(item_ids):
+    return {item.pk: item.available_quantity for item in Item.objects.with_stock().filter(pk__in=item_ids)}
+
+
+def units_sold(item_ids):
+    return dict(Order.objects.filter(item_id__in=item_ids).values_list('item_id').annotate(units=Sum('quantity')))
+
+
+class BuyClient:
+    """
+    Sends buy requests either to a running server (`base_url`) or through Django's test client in-process.
+    Every worker thread gets its own client and database connection.
+    """
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.local = threading.local()
+
+    def buy(self, item_id, quantity):
+        path = reverse('item-buy', kwargs={'pk': item_id})
+        if self.base_url:
+            request = urllib.request.Request(
+                f'{self.base_url}{path}', data=json.dumps({'quantity': quantity}).encode(),
+                headers={'Content-Type': 'application/json'}, method='POST',
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status
+            except urllib.error.HTTPError as exc:
+                return exc.code
+
+        if not hasattr(self.local, 'client'):
+            # The test client's default host, testserver, is only allowed while tests run
+            self.local.client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+        return self.local.client.post(path, {'quantity': quantity}).status_code
+
+
+def run_load_test(item_ids, requests=1000, workers=8, skew=1.0, quantities=(1, 3), base_url=None, seed=None):
+    """
+    Fires `requests` purchases from `workers` threads and reports throughput, latency percentiles and
+    whether stock and orders still add up afterwards.
+    """
+    plan = weighted_plan(item_ids, requests, skew, quantities, seed)
+    initial_stock = stock_levels(item_ids)
+    initial_sold = units_sold(item_ids)
+    initial_orders = Order.objects.filter(item_id__in=item_ids).count()
+    client = BuyClient(base_url)
+
+    def send(purchase):
+        started = time.perf_counter()
+        try:
+            status_code = client.buy(*purchase)
+        finally:
+            if not base_url:
+                connection.close()
+        return status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(send, plan))
+    elapsed = time.perf_counter() - started
+
+    statuses = [status_code for status_code, _ in results]
+    latencies = np.array([latency for _, latency in results]) * 1000
+    final_stock = stock_levels(item_ids)
+    final_sold = units_sold(item_ids)
+    successes = statuses.count(200)
+
+    mismatches = {
+        item_id: {'initial': initial_stock[item_id], 'final': final_stock[item_id],
+                  'sold': final_sold.get(item_id, 0) - initial_sold.get(item_id, 0)}
+        for item_id in initial_stock
+        if final_stock[item_id] + final_sold.get(item_id, 0) - initial_sold.get(item_id, 0) != initial_stock[item_id]
+    }
+    new_orders = Order.objects.filter(item_id__in=item_ids).count() - initial_orders
+
+    return {
+        'requests': len(plan),
+        'successes': successes,
+        'rejected': sum(1 for status_code in statuses if 400 <= status_code < 500),
+        'errors': sum(1 for status_code in statuses if status_code >= 500),
+        'elapsed': elapsed,
+        'requests_per_second': len(plan) / elapsed if elapsed else 0,
+        'latency_ms': {
+            f'p{percentile}': float(np.percentile(latencies, percentile)) if len(latencies) else 0
+            for percentile in (50, 90, 95, 99)
+        },
+        'stock_mismatches': mismatches,
+        'new_orders': new_orders,
+        'invariants_hold': not mismatches and new_orders == successes,
+    }
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from item.archive import ARCHIVE_BATCH_SIZE, archive_cutoff, archive_order_batches
+
+
+class Command(BaseCommand):
+    help = 'Moves old orders from the Order table into the archive in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive orders older than this many days, ORDER_ARCHIVE_AFTER_DAYS by default.')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days can\'t be negative.')
+        before = archive_cutoff(options['days'])
+
+        archived = 0
+        for count in archive_order_batches(before, options['batch_size']):
+            archived += count
+            self.stdout.write(f'{archived} orders archived.')
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} orders placed before {before:%Y-%m-%d %H:%M}.'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from item.models import ArchivedOrder, Order
+from item.orders import ACCOUNT_BACKFILL_BATCH_SIZE, link_account_batches
+
+
+class Command(BaseCommand):
+    help = 'Links hot and archived orders to the integer account key in small batches, while the site stays up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ACCOUNT_BACKFILL_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches, to leave the database room for live traffic.')
+
+    def handle(self, *args, **options):
+        for model in (Order, ArchivedOrder):
+            linked = 0
+            for count in link_account_batches(model, options['batch_size']):
+                linked += count
+                self.stdout.write(f'{linked} {model._meta.verbose_name_plural} linked.')
+                time.sleep(options['pause'])
+            self.stdout.write(self.style.SUCCESS(f'Linked {linked} {model._meta.verbose_name_plural} to accounts.'))
+
+        remaining = Order.objects.filter(account__isnull=True).count() + \
+            ArchivedOrder.objects.filter(account__isnull=True).count()
+        if remaining:
+            self.stdout.write(self.style.WARNING(f'{remaining} orders are still missing an account.'))
+        else:
+            self.stdout.write('Every order has an account, reads can switch to ORDER_READS_BY_ACCOUNT.')
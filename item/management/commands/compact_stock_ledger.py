@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from item.ledger import compact_ledger
+
+
+class Command(BaseCommand):
+    help = 'Folds old stock movements into per-item snapshots so current and historical stock stay fast to read.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-minutes', type=int, default=60,
+                            help='Only fold movements older than this, recent ones stay in the ledger.')
+        parser.add_argument('--prune', action='store_true', help='Delete the movements that were folded.')
+
+    def handle(self, *args, **options):
+        count = compact_ledger(timedelta(minutes=options['older_than_minutes']), prune=options['prune'])
+        self.stdout.write(self.style.SUCCESS(f'Created {count} stock snapshots.'))
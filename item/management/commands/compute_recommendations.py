@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from item.recommendations import RECOMMENDATIONS_PER_ITEM, compute_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the bought-together and same-category recommendations shown after a purchase.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=RECOMMENDATIONS_PER_ITEM,
+                            help='Recommendations to keep per item.')
+
+    def handle(self, *args, **options):
+        count = compute_recommendations(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {count} recommendations.'))
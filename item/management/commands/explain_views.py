@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from core.models import Account
+from item.models import DailySales, Item, Order
+from item.orders import orders_of
+from item.statistics import revenue_by_category, top_selling_products
+
+# Plan fragments that mean a full scan or an extra sort step, per database vendor
+WARNING_MARKERS = {
+    'sqlite': ['SCAN ', 'USE TEMP B-TREE'],
+    'postgresql': ['Seq Scan', 'Sort'],
+}
+
+
+def representative_queries():
+    """
+    Returns (view, description, queryset) for the queries the API runs on every request of each view.
+    """
+    user = Account.objects.first() or Account(pk=1, email='user@example.com')
+    orders = orders_of(Order.objects.all(), user)
+    item = Item.objects.values('pk', 'category_id').first() or {'pk': 1, 'category_id': 1}
+
+    return [
+        ('ItemViewSet', 'list items', Item.objects.all()),
+        ('item_buy', 'related items', Item.objects.filter(category=item['category_id']).exclude(pk=item['pk'])[:3]),
+        ('OrderHistoryView', 'orders of a user', orders.order_by('-order_date', '-id')),
+        ('OrderHistoryView', 'orders after a date',
+         orders.filter(order_date__gte='2024-01-01T00:00:00Z').order_by('-order_date', '-id')),
+        ('OrderHistoryView', 'next page of a user\'s orders',
+         orders.filter(Q(order_date__lt='2024-01-01T00:00:00Z') | Q(order_date='2024-01-01T00:00:00Z', id__lt=1))
+         .order_by('-order_date', '-id')[:21]),
+        ('BusinessStatisticsView', 'totals', DailySales.objects.values('revenue', 'orders')),
+        ('BusinessStatisticsView', 'revenue by category', revenue_by_category()),
+        ('BusinessStatisticsView', 'top selling products', top_selling_products()),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Prints the query plan of every representative view query and flags full scans and extra sorts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail-on-warnings', action='store_true',
+                            help='Exit with an error if any plan contains a scan or a temporary sort.')
+
+    def handle(self, *args, **options):
+        markers = WARNING_MARKERS.get(connection.vendor, [])
+        flagged = 0
+
+        for view, description, queryset in representative_queries():
+            plan = queryset.explain()
+            warnings = [line for line in plan.splitlines() if any(marker in line for marker in markers)]
+            flagged += bool(warnings)
+
+            style = self.style.WARNING if warnings else self.style.SUCCESS
+            self.stdout.write(style(f'{view}: {description}'))
+            for line in plan.splitlines():
+                self.stdout.write(f'  {"!" if line in warnings else " "} {line}')
+
+        if flagged and options['fail_on_warnings']:
+            raise CommandError(f'{flagged} queries scan a table or sort in a temporary structure.')
+        self.stdout.write(f'{flagged} queries flagged.')
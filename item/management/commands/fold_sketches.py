@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from item.sketches import SKETCH_FOLD_BATCH_SIZE, fold_sketch_events, purge_old_sketches
+
+
+class Command(BaseCommand):
+    help = 'Folds queued purchases into the analytics sketches and deletes sketches past their retention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SKETCH_FOLD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        folded = sum(fold_sketch_events(options['batch_size']))
+        purged = purge_old_sketches()
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} purchases and deleted {purged} old sketches.'))
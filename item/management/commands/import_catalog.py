@@ -0,0 +1,131 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from item.bulk import BULK_CHUNK_SIZE, chunked
+from item.ledger import record_movements
+from item.models import Category, Item, StockMovement
+from item.serializers import ItemBulkRowSerializer
+from item.signals import catalog_changed
+
+
+def read_rows(path, file_format):
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            # Lines are decoded per row by the command, so a malformed one is reported rather than fatal
+            for line in file:
+                if line.strip():
+                    yield line
+
+
+def parse_row(row):
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as exc:
+            raise ValidationError({'non_field_errors': [f'Invalid JSON: {exc}.']})
+    if not isinstance(row, dict):
+        raise ValidationError({'non_field_errors': ['Expected an object.']})
+    return row
+
+
+class Command(BaseCommand):
+    help = 'Streams items from a CSV or JSONL file into the catalog, creating missing categories by name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format, guessed from the extension when omitted.')
+        parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE)
+        parser.add_argument('--checkpoint', help='Checkpoint file, defaults to <path>.checkpoint.')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'File {path} does not exist.')
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+
+        skip = 0
+        if os.path.exists(checkpoint) and not options['restart']:
+            with open(checkpoint) as file:
+                skip = int(file.read().strip() or 0)
+            self.stdout.write(f'Resuming after row {skip}.')
+
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.serializer = ItemBulkRowSerializer()
+        processed = skip
+        imported = 0
+        failed = 0
+        started = time.monotonic()
+
+        rows = read_rows(path, file_format)
+        for _ in range(skip):
+            next(rows, None)
+
+        for chunk in chunked(rows, options['chunk_size']):
+            items = []
+            for offset, row in enumerate(chunk, start=processed + 1):
+                try:
+                    items.append(self.build_item(row))
+                except ValidationError as exc:
+                    failed += 1
+                    self.stderr.write(f'Row {offset}: {exc.detail}')
+
+            with transaction.atomic():
+                # Categories are only created for rows that passed validation, and roll back with the chunk
+                categories = self.resolve_categories({name for name, _ in items})
+                for name, item in items:
+                    item.category_id = categories[name]
+                items = [item for _, item in items]
+                Item.objects.bulk_create(items)
+                record_movements((item.pk, item.quantity, StockMovement.IMPORT) for item in items)
+            self.categories.update(categories)
+            processed += len(chunk)
+            imported += len(items)
+            with open(checkpoint, 'w') as file:
+                file.write(str(processed))
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{processed} rows processed, {imported} imported ({imported / elapsed:.0f} rows/s).')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        if imported:
+            catalog_changed.send(sender=Item, item_ids=None)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} items, skipped {failed} invalid rows in {elapsed:.1f}s '
+            f'({imported / elapsed if elapsed else 0:.0f} rows/s).'
+        ))
+
+    def build_item(self, row):
+        """
+        Validates one row and returns its category name with the unsaved item, which has no category yet.
+        """
+        row = {key: value for key, value in parse_row(row).items() if value not in ('', None)}
+        category_name = row.pop('category', None)
+        if not category_name:
+            raise ValidationError({'category': ['This field is required.']})
+        if not isinstance(category_name, str):
+            raise ValidationError({'category': ['Expected a category name.']})
+        row.pop('id', None)
+
+        data = self.serializer.run_validation({**row, 'category': 0})
+        data.pop('category')
+        return category_name, Item(**data)
+
+    def resolve_categories(self, names):
+        categories = {name: self.categories[name] for name in names if name in self.categories}
+        for name in names - set(categories):
+            categories[name] = Category.objects.get_or_create(name=name)[0].pk
+        return categories
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Account
+from item.loadtest import run_load_test
+from item.models import Item
+from item.orders import ANONYMOUS_EMAIL
+
+
+class Command(BaseCommand):
+    help = ('Drives the buy endpoint from many threads and checks that no stock was oversold. Without --url the '
+            'requests go through Django in-process; with --url the server must use this database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('item_ids', nargs='*', type=int, help='Items to buy, all items without prescription '
+                                                                  'by default.')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf exponent of item popularity, 0 spreads purchases evenly.')
+        parser.add_argument('--min-quantity', type=int, default=1)
+        parser.add_argument('--max-quantity', type=int, default=3)
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000.')
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        item_ids = options['item_ids'] or list(
+            Item.objects.filter(is_with_prescription=False).order_by('pk').values_list('pk', flat=True)
+        )
+        if not item_ids:
+            raise CommandError('No items to buy.')
+        if not Account.objects.filter(email=ANONYMOUS_EMAIL).exists():
+            raise CommandError(f'Anonymous purchases need an account with email {ANONYMOUS_EMAIL}.')
+
+        report = run_load_test(
+            item_ids, requests=options['requests'], workers=options['workers'], skew=options['skew'],
+            quantities=(options['min_quantity'], options['max_quantity']), base_url=options['url'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(f'{report["requests"]} requests in {report["elapsed"]:.2f}s '
+                          f'({report["requests_per_second"]:.1f} req/s): {report["successes"]} bought, '
+                          f'{report["rejected"]} rejected, {report["errors"]} errors.')
+        self.stdout.write('Latency: ' + ', '.join(f'{name} {value:.1f}ms'
+                                                  for name, value in report['latency_ms'].items()))
+        if not report['successes'] or report['errors']:
+            raise CommandError(f'The load test is not meaningful: {report["successes"]} purchases succeeded and '
+                               f'{report["errors"]} requests failed with a server error.')
+        if not report['invariants_hold']:
+            raise CommandError(f'Invariants violated: {report["new_orders"]} new orders for {report["successes"]} '
+                               f'successful purchases, stock mismatches {report["stock_mismatches"]}.')
+        self.stdout.write(self.style.SUCCESS('Stock and orders add up.'))
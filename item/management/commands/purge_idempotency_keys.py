@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from item.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL.'
+
+    def handle(self, *args, **options):
+        count = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} expired idempotency keys.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from item.cohorts import rebuild_cohorts
+
+
+class Command(BaseCommand):
+    help = 'Recomputes customer activity bitmaps and cohort retention counts from all hot and archived orders.'
+
+    def handle(self, *args, **options):
+        customers = rebuild_cohorts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt cohort activity for {customers} customers.'))
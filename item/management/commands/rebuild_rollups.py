@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from item.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollups from all hot and archived orders.'
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups for {days} days.'))
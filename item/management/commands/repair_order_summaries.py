@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from item.summaries import SUMMARY_BATCH_SIZE, repair_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-account order counters from all hot and archived orders in batches of accounts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SUMMARY_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        repaired = 0
+        for count in repair_summaries(options['batch_size']):
+            repaired += count
+            self.stdout.write(f'{repaired} accounts checked.')
+        self.stdout.write(self.style.SUCCESS(f'Repaired the order summaries of {repaired} accounts.'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from item.models import Item
+from item.stock import rebalance_shards, set_shard_count
+
+
+class Command(BaseCommand):
+    help = 'Splits the stock of items into counter shards, changes their shard count or rebalances them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('item_ids', nargs='*', type=int,
+                            help='Items to change, all sharded items when rebalancing without ids.')
+        parser.add_argument('--shards', type=int, help='Number of shards, 0 moves the stock back onto the item.')
+        parser.add_argument('--rebalance', action='store_true', help='Even out the existing shards.')
+
+    def handle(self, *args, **options):
+        if options['shards'] is None and not options['rebalance']:
+            raise CommandError('Pass --shards or --rebalance.')
+
+        items = Item.objects.all()
+        if options['item_ids']:
+            items = items.filter(pk__in=options['item_ids'])
+        elif options['shards'] is not None:
+            raise CommandError('Pass the ids of the items to shard.')
+
+        if options['shards'] is not None:
+            if options['shards'] < 0:
+                raise CommandError('--shards must be 0 or more.')
+            for item in items:
+                set_shard_count(item, options['shards'])
+                self.stdout.write(f'{item}: {options["shards"]} shards.')
+        else:
+            for item in items.filter(stock_shard_count__gt=0):
+                total = rebalance_shards(item)
+                self.stdout.write(f'{item}: rebalanced {total} units over {item.stock_shard_count} shards.')
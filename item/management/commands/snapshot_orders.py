@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from item.columnar import append_snapshot, compact_snapshot, read_manifest, snapshot_dir
+
+
+class Command(BaseCommand):
+    help = 'Appends new orders to the columnar .npy snapshot used by the order analytics endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Snapshot directory, ORDER_SNAPSHOT_DIR by default.')
+        parser.add_argument('--compact', action='store_true', help='Merge all segments into one afterwards.')
+
+    def handle(self, *args, **options):
+        directory = snapshot_dir(options['dir'])
+        added = append_snapshot(directory)
+        if options['compact']:
+            compact_snapshot(directory)
+
+        manifest = read_manifest(directory)
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {added} orders, the snapshot in {directory} has {manifest["rows"]} orders in '
+            f'{len(manifest["segments"])} segments.'
+        ))
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0003_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField(default=0)),
+                ('kind', models.CharField(choices=[('co_purchase', 'Bought together'), ('category', 'Same category')], max_length=20)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='item.item')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_in', to='item.item')),
+            ],
+            options={
+                'ordering': ('item', 'rank'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='itemrecommendation',
+            constraint=models.UniqueConstraint(fields=('item', 'rank'), name='unique_item_recommendation_rank'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:38
+
+import django.db.models.deletion
+import item.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0005_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='stock_shard_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('quantity', models.IntegerField(default=0, validators=[item.models.MinValueValidator(0)])),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='item.item')),
+            ],
+            options={
+                'ordering': ('item', 'number'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockshard',
+            constraint=models.UniqueConstraint(fields=('item', 'number'), name='unique_stock_shard'),
+        ),
+    ]
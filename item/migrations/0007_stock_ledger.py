@@ -0,0 +1,61 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def record_opening_balances(apps, schema_editor):
+    Item = apps.get_model('item', 'Item')
+    StockMovement = apps.get_model('item', 'StockMovement')
+    sharded = dict(
+        apps.get_model('item', 'StockShard').objects.values_list('item').annotate(total=Sum('quantity'))
+    )
+    StockMovement.objects.bulk_create(
+        (StockMovement(item_id=item_id, delta=sharded.get(item_id, 0) if shard_count else quantity,
+                       reason='opening')
+         for item_id, quantity, shard_count in Item.objects.values_list('id', 'quantity', 'stock_shard_count')),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0006_stock_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('purchase', 'Purchase'),
+                                                     ('staff_edit', 'Staff edit'), ('bulk_update', 'Bulk update'),
+                                                     ('import', 'Import')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='stock_movements', to='item.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'created_at'], name='stock_movement_item_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('as_of', models.DateTimeField()),
+                ('last_movement_id', models.BigIntegerField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                           related_name='stock_snapshots', to='item.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', 'as_of'], name='stock_snapshot_item_date_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
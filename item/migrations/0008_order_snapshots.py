@@ -0,0 +1,50 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def snapshot_order_items(apps, schema_editor):
+    # The price paid per unit is what the order was charged, not what the item costs today
+    Order = apps.get_model('item', 'Order')
+    orders = Order.objects.filter(item_name='').select_related('item').only(
+        'id', 'total_price', 'quantity', 'item__name').order_by('pk')
+    batch = []
+    for order in orders.iterator(chunk_size=1000):
+        order.item_name = order.item.name
+        order.unit_price = round(order.total_price / order.quantity, 2) if order.quantity else order.total_price
+        batch.append(order)
+        if len(batch) == 1000:
+            Order.objects.bulk_update(batch, ['item_name', 'unit_price'])
+            batch = []
+    Order.objects.bulk_update(batch, ['item_name', 'unit_price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0007_stock_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_date_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-order_date', '-id'], name='order_user_date_id_idx'),
+        ),
+        migrations.RunPython(snapshot_order_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0008_order_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('quantity', models.PositiveIntegerField()),
+                ('order_date', models.DateTimeField()),
+                ('item_name', models.CharField(blank=True, default='', max_length=255)),
+                ('unit_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT,
+                                           related_name='archived_orders', to='item.item')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT,
+                                           related_name='archived_orders', to=settings.AUTH_USER_MODEL,
+                                           to_field='email')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user', '-order_date', '-id'], name='archived_user_date_id_idx'),
+                    models.Index(fields=['order_date'], name='archived_order_date_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.0.7 on 2026-10-18 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    rollups = {name: {} for name in ('DailySales', 'DailyCategorySales', 'DailyItemSales')}
+    for name in ('Order', 'ArchivedOrder'):
+        rows = apps.get_model('item', name).objects.annotate(day=TruncDate('order_date')).values(
+            'day', 'item__category', 'item_id').annotate(revenue=Sum('total_price'), units=Sum('quantity'),
+                                                         orders=Count('id')).order_by()
+        for row in rows.iterator():
+            for model, lookup in (('DailySales', {'day': row['day']}),
+                                  ('DailyCategorySales', {'day': row['day'], 'category_id': row['item__category']}),
+                                  ('DailyItemSales', {'day': row['day'], 'item_id': row['item_id']})):
+                totals = rollups[model].setdefault(tuple(lookup.items()), {'revenue': 0, 'units': 0, 'orders': 0})
+                for field in totals:
+                    totals[field] += row[field]
+
+    for name, grouped in rollups.items():
+        model = apps.get_model('item', name)
+        model.objects.bulk_create((model(**dict(key), **totals) for key, totals in grouped.items()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0009_archived_orders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('day', models.DateField(unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'ordering': ('day',),
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales',
+                                               to='item.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily category sales',
+                'ordering': ('day', 'category'),
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyItemSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('day', models.DateField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales',
+                                           to='item.item')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily item sales',
+                'ordering': ('day', 'item'),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='unique_daily_category_sales'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyitemsales',
+            constraint=models.UniqueConstraint(fields=('day', 'item'), name='unique_daily_item_sales'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
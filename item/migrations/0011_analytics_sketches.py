@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0010_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('buyers', 'Distinct buyers'), ('items', 'Units per item')],
+                                          max_length=20)),
+                ('bucket_start', models.DateTimeField()),
+                ('data', models.BinaryField(default=b'')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='analyticssketch',
+            constraint=models.UniqueConstraint(fields=('kind', 'bucket_start'), name='unique_analytics_sketch'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:06
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def backfill_cohorts(apps, schema_editor):
+    months_by_user = {}
+    for name in ('Order', 'ArchivedOrder'):
+        rows = apps.get_model('item', name).objects.exclude(user_id='anonymous@example.com').annotate(
+            month=TruncMonth('order_date')).values_list('user_id', 'month').distinct()
+        for email, month in rows.iterator():
+            months_by_user.setdefault(email, set()).add(month.year * 12 + month.month - 1)
+
+    CustomerActivity = apps.get_model('item', 'CustomerActivity')
+    CohortCell = apps.get_model('item', 'CohortCell')
+    activities = []
+    counts = {}
+    for email, months in months_by_user.items():
+        first = min(months)
+        bits = sum(1 << (month - first) for month in months)
+        first_month = datetime.date(first // 12, first % 12 + 1, 1)
+        activities.append(CustomerActivity(user_id=email, first_month=first_month,
+                                           months=bits.to_bytes((bits.bit_length() + 7) // 8, 'little')))
+        for month in months:
+            counts[(first_month, month - first)] = counts.get((first_month, month - first), 0) + 1
+
+    CustomerActivity.objects.bulk_create(activities, batch_size=1000)
+    CohortCell.objects.bulk_create((CohortCell(cohort=cohort, offset=offset, customers=customers)
+                                    for (cohort, offset), customers in counts.items()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0011_analytics_sketches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CohortCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cohort', models.DateField()),
+                ('offset', models.PositiveSmallIntegerField()),
+                ('customers', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('cohort', 'offset'),
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_month', models.DateField()),
+                ('months', models.BinaryField(default=b'')),
+            ],
+            options={
+                'verbose_name_plural': 'Customer activities',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cohortcell',
+            constraint=models.UniqueConstraint(fields=('cohort', 'offset'), name='unique_cohort_cell'),
+        ),
+        migrations.AddField(
+            model_name='customeractivity',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='activity',
+                                       to=settings.AUTH_USER_MODEL, to_field='email'),
+        ),
+        migrations.RunPython(backfill_cohorts, migrations.RunPython.noop),
+    ]
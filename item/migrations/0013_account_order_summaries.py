@@ -0,0 +1,52 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    accounts = dict(apps.get_model('core', 'Account').objects.values_list('email', 'id'))
+    totals = {}
+    for name in ('Order', 'ArchivedOrder'):
+        rows = apps.get_model('item', name).objects.values('user_id').annotate(
+            count=Count('id'), spent=Sum('total_price'), last=Max('order_date')).order_by()
+        for row in rows:
+            count, spent, last = totals.get(row['user_id'], (0, 0, None))
+            totals[row['user_id']] = (count + row['count'], spent + row['spent'],
+                                      max(last, row['last']) if last else row['last'])
+
+    AccountOrderSummary = apps.get_model('item', 'AccountOrderSummary')
+    AccountOrderSummary.objects.bulk_create(
+        (AccountOrderSummary(account_id=accounts[email], order_count=count, total_spent=spent, last_order_date=last)
+         for email, (count, spent, last) in totals.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('item', '0012_customer_cohorts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountOrderSummary',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                 related_name='order_summary', serialize=False,
+                                                 to=settings.AUTH_USER_MODEL)),
+                ('order_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_order_date', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Account order summaries',
+                'indexes': [models.Index(fields=['-total_spent'], name='order_summary_spent_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
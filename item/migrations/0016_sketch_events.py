@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0015_idempotency_request_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SketchEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_date', models.DateTimeField()),
+                ('buyer', models.CharField(blank=True, max_length=60)),
+                ('item_id', models.BigIntegerField()),
+                ('quantity', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:20
+
+import datetime
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+
+def rebuild_cohorts(apps, schema_editor):
+    months_by_account = {}
+    for name in ('Order', 'ArchivedOrder'):
+        rows = apps.get_model('item', name).objects.exclude(user_id='anonymous@example.com').annotate(
+            month=TruncMonth('order_date')).values_list('user__pk', 'month').distinct()
+        for account_id, month in rows.iterator():
+            months_by_account.setdefault(account_id, set()).add(month.year * 12 + month.month - 1)
+
+    CustomerActivity = apps.get_model('item', 'CustomerActivity')
+    CohortCell = apps.get_model('item', 'CohortCell')
+    activities = []
+    counts = {}
+    for account_id, months in months_by_account.items():
+        first = min(months)
+        bits = sum(1 << (month - first) for month in months)
+        first_month = datetime.date(first // 12, first % 12 + 1, 1)
+        activities.append(CustomerActivity(account_id=account_id, first_month=first_month,
+                                           months=bits.to_bytes((bits.bit_length() + 7) // 8, 'little')))
+        for month in months:
+            counts[(first_month, month - first)] = counts.get((first_month, month - first), 0) + 1
+
+    CohortCell.objects.all().delete()
+    CustomerActivity.objects.bulk_create(activities, batch_size=1000)
+    CohortCell.objects.bulk_create((CohortCell(cohort=cohort, offset=offset, customers=customers)
+                                    for (cohort, offset), customers in counts.items()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0016_sketch_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='CustomerActivity',
+        ),
+        migrations.CreateModel(
+            name='CustomerActivity',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                                 related_name='activity', serialize=False,
+                                                 to=settings.AUTH_USER_MODEL)),
+                ('first_month', models.DateField()),
+                ('months', models.BinaryField(default=b'')),
+            ],
+            options={
+                'verbose_name_plural': 'Customer activities',
+            },
+        ),
+        migrations.RunPython(rebuild_cohorts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
+from decimal import Decimal
+
 from django.core.validators import BaseValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from core.models import Account
 
@@ -23,26 +27,366 @@ class Category(models.Model):
         return self.name
 
 
+class ItemQuerySet(models.QuerySet):
+    def with_stock(self):
+        """
+        Annotates `stock`, the sellable quantity: the quantity column, or the sum of the stock shards for
+        items that use them.
+        """
+        shard_total = StockShard.objects.filter(item=models.OuterRef('pk')).values('item').annotate(
+            total=models.Sum('quantity')).values('total')
+        return self.annotate(stock=models.Case(
+            models.When(stock_shard_count=0, then=models.F('quantity')),
+            default=Coalesce(models.Subquery(shard_total), 0),
+        ))
+
+
 class Item(models.Model):
     category = models.ForeignKey(Category, related_name='items', on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     price = models.FloatField()
     image = models.ImageField(upload_to='item_images', blank=True, null=True)
+    image_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
     quantity = models.IntegerField(default=0, null=False, validators=[MinValueValidator(0)])
     updated_at = models.DateTimeField(auto_now_add=True)
     is_with_prescription = models.BooleanField(default=False)
+    stock_shard_count = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = ItemQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    @property
+    def available_quantity(self):
+        if not self.stock_shard_count:
+            return self.quantity
+        if hasattr(self, 'stock'):
+            return self.stock
+        return self.stock_shards.aggregate(total=Coalesce(models.Sum('quantity'), 0))['total']
+
+
+class StockShard(models.Model):
+    """
+    One slice of a sharded item's stock. Buyers decrement a random shard, so purchases of a hot item
+    spread their row locks over several rows instead of queueing on one.
+    """
+    item = models.ForeignKey(Item, related_name='stock_shards', on_delete=models.CASCADE)
+    number = models.PositiveSmallIntegerField()
+    quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+
+    class Meta:
+        ordering = ('item', 'number')
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'number'], name='unique_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.item} shard {self.number}'
+
 
 class Order(models.Model):
     item = models.ForeignKey(Item, related_name='item', on_delete=models.PROTECT)
     user = models.ForeignKey(Account, related_name='user', on_delete=models.PROTECT, to_field='email')
+    # Integer key replacing the email join, filled by backfill_order_accounts for orders placed before it existed
+    account = models.ForeignKey(Account, related_name='orders', on_delete=models.PROTECT, null=True, blank=True,
+                                db_index=False)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
     order_date = models.DateTimeField(verbose_name='order_date', auto_now_add=True)
+    # Copied from the item at purchase time, so order history renders without joining Item
+    item_name = models.CharField(max_length=255, blank=True, default='')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-order_date', '-id'], name='order_user_date_id_idx'),
+            models.Index(fields=['account', '-order_date', '-id'], name='order_account_date_id_idx'),
+            models.Index(fields=['order_date'], name='order_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.snapshot_item()
+        self.link_account()
+        # Receivers of post_save update counters that must commit or roll back together with the order
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def snapshot_item(self):
+        if not self.item_name:
+            self.item_name = self.item.name
+        if self.unit_price is None:
+            self.unit_price = round(Decimal(str(self.item.price)), 2)
+
+    def link_account(self):
+        if self.account_id is None and self.user_id:
+            self.account_id = self.user.pk
 
     def __str__(self):
         return f'Order by {self.user} for {self.quantity} of {self.item} on {self.order_date}'
+
+
+class ArchivedOrder(models.Model):
+    """
+    An order moved out of the Order table once it got old. It keeps the original id and purchase data.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    item = models.ForeignKey(Item, related_name='archived_orders', on_delete=models.PROTECT)
+    user = models.ForeignKey(Account, related_name='archived_orders', on_delete=models.PROTECT, to_field='email')
+    account = models.ForeignKey(Account, related_name='archived_account_orders', on_delete=models.PROTECT,
+                                null=True, blank=True, db_index=False)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    order_date = models.DateTimeField()
+    item_name = models.CharField(max_length=255, blank=True, default='')
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-order_date', '-id'], name='archived_user_date_id_idx'),
+            models.Index(fields=['account', '-order_date', '-id'], name='archived_account_date_id_idx'),
+            models.Index(fields=['order_date'], name='archived_order_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Archived order by {self.user_id} for {self.quantity} of {self.item_name} on {self.order_date}'
+
+
+class SalesRollup(models.Model):
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    """
+    Sales totals of one day, kept up to date as orders are placed. Archived orders still count.
+    """
+    day = models.DateField(unique=True)
+
+    class Meta:
+        ordering = ('day',)
+        verbose_name_plural = 'Daily sales'
+
+    def __str__(self):
+        return f'Sales on {self.day}'
+
+
+class DailyCategorySales(SalesRollup):
+    day = models.DateField()
+    category = models.ForeignKey(Category, related_name='daily_sales', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ('day', 'category')
+        verbose_name_plural = 'Daily category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='unique_daily_category_sales'),
+        ]
+
+    def __str__(self):
+        return f'Sales of {self.category} on {self.day}'
+
+
+class DailyItemSales(SalesRollup):
+    day = models.DateField()
+    item = models.ForeignKey(Item, related_name='daily_sales', on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ('day', 'item')
+        verbose_name_plural = 'Daily item sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'item'], name='unique_daily_item_sales'),
+        ]
+
+    def __str__(self):
+        return f'Sales of {self.item} on {self.day}'
+
+
+class AnalyticsSketch(models.Model):
+    """
+    A compressed probabilistic sketch of the purchases in one time bucket: a HyperLogLog of the buyers or a
+    Count-Min sketch of the units sold per item. Buckets are merged to answer questions about longer windows.
+    """
+    BUYERS = 'buyers'
+    ITEMS = 'items'
+    KIND_CHOICES = [
+        (BUYERS, 'Distinct buyers'),
+        (ITEMS, 'Units per item'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    bucket_start = models.DateTimeField()
+    data = models.BinaryField(default=b'')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'bucket_start'], name='unique_analytics_sketch'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} from {self.bucket_start}'
+
+
+class SketchEvent(models.Model):
+    """
+    A purchase waiting to be folded into the analytics sketches. Buys only append these rows, so they never
+    wait on each other for a sketch; the fold_sketches command applies them in batches.
+    """
+    order_date = models.DateTimeField()
+    buyer = models.CharField(max_length=60, blank=True)
+    item_id = models.BigIntegerField()
+    quantity = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f'{self.quantity} of item {self.item_id} at {self.order_date}'
+
+
+class CustomerActivity(models.Model):
+    """
+    The month of a customer's first order and a bitmap of the months they ordered in, where bit k stands
+    for k months after the first one.
+    """
+    account = models.OneToOneField(Account, primary_key=True, related_name='activity', on_delete=models.CASCADE)
+    first_month = models.DateField()
+    months = models.BinaryField(default=b'')
+
+    class Meta:
+        verbose_name_plural = 'Customer activities'
+
+    def __str__(self):
+        return f'Activity of {self.account} since {self.first_month:%Y-%m}'
+
+
+class CohortCell(models.Model):
+    """
+    How many customers whose first order was in `cohort` ordered `offset` months later.
+    """
+    cohort = models.DateField()
+    offset = models.PositiveSmallIntegerField()
+    customers = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ('cohort', 'offset')
+        constraints = [
+            models.UniqueConstraint(fields=['cohort', 'offset'], name='unique_cohort_cell'),
+        ]
+
+    def __str__(self):
+        return f'Cohort {self.cohort:%Y-%m} +{self.offset}: {self.customers}'
+
+
+class AccountOrderSummary(models.Model):
+    """
+    Lifetime order figures of an account, kept up to date as orders are placed. Archived orders still count.
+    """
+    account = models.OneToOneField(Account, primary_key=True, related_name='order_summary',
+                                   on_delete=models.CASCADE)
+    order_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_order_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Account order summaries'
+        indexes = [
+            models.Index(fields=['-total_spent'], name='order_summary_spent_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_count} orders by {self.account}'
+
+
+class ItemRecommendation(models.Model):
+    CO_PURCHASE = 'co_purchase'
+    CATEGORY = 'category'
+    KIND_CHOICES = [
+        (CO_PURCHASE, 'Bought together'),
+        (CATEGORY, 'Same category'),
+    ]
+
+    item = models.ForeignKey(Item, related_name='recommendations', on_delete=models.CASCADE)
+    recommended = models.ForeignKey(Item, related_name='recommended_in', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField(default=0)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+
+    class Meta:
+        ordering = ('item', 'rank')
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'rank'], name='unique_item_recommendation_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.recommended} for {self.item} ({self.kind})'
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=64)
+    # Hash of the request body, so a key reused for a different request is refused instead of replayed
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content = models.BinaryField(default=b'')
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'scope'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class StockMovement(models.Model):
+    """
+    Append-only record of one change to an item's stock. Rows are only ever inserted.
+    """
+    OPENING = 'opening'
+    PURCHASE = 'purchase'
+    STAFF_EDIT = 'staff_edit'
+    BULK_UPDATE = 'bulk_update'
+    IMPORT = 'import'
+    REASON_CHOICES = [
+        (OPENING, 'Opening balance'),
+        (PURCHASE, 'Purchase'),
+        (STAFF_EDIT, 'Staff edit'),
+        (BULK_UPDATE, 'Bulk update'),
+        (IMPORT, 'Import'),
+    ]
+
+    item = models.ForeignKey(Item, related_name='stock_movements', on_delete=models.CASCADE)
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'created_at'], name='stock_movement_item_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.delta:+d} {self.item} ({self.reason})'
+
+
+class StockSnapshot(models.Model):
+    """
+    Stock of an item after folding in every movement up to and including `last_movement_id`.
+    """
+    item = models.ForeignKey(Item, related_name='stock_snapshots', on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    as_of = models.DateTimeField()
+    last_movement_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'as_of'], name='stock_snapshot_item_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.item}: {self.quantity} as of {self.as_of}'
@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Item, Order
+from .signals import orders_placed
+from .stock import decrement_stock, available_stock
+
+ANONYMOUS_EMAIL = 'anonymous@example.com'
+ACCOUNT_BACKFILL_BATCH_SIZE = 1000
+
+
+class CheckoutError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def order_user(request):
+    if request.user.is_authenticated:
+        return request.user
+    return get_user_model().objects.get(email=ANONYMOUS_EMAIL)
+
+
+def orders_of(queryset, account):
+    """
+    Narrows an Order or ArchivedOrder queryset to one account, by its integer key once the backfill is done.
+    """
+    if settings.ORDER_READS_BY_ACCOUNT:
+        return queryset.filter(account=account)
+    return queryset.filter(user=account)
+
+
+def link_account_batches(model, batch_size=ACCOUNT_BACKFILL_BATCH_SIZE):
+    """
+    Fills the integer account key of `model` rows that only have the email one, walking them by primary key,
+    and yields the size of every batch. Each batch is a short UPDATE of its own, so the backfill can run
+    while orders keep coming in and can be interrupted and restarted at any time.
+    """
+    account = get_user_model().objects.filter(email=OuterRef('user_id')).values('pk')[:1]
+    last_pk = 0
+    while True:
+        ids = list(model.objects.filter(account__isnull=True, pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        model.objects.filter(pk__in=ids).update(account_id=Subquery(account))
+        last_pk = ids[-1]
+        yield len(ids)
+
+
+def create_orders(orders):
+    for order in orders:
+        order.snapshot_item()
+        order.link_account()
+    with transaction.atomic():
+        orders = Order.objects.bulk_create(orders)
+        orders_placed.send(sender=Order, orders=orders)
+    return orders
+
+
+def checkout(user, lines):
+    """
+    Buys several items at once. `lines` is a list of (item_id, quantity) pairs. Either every line is bought
+    or, on the first problem, nothing is and CheckoutError is raised. Returns the created orders and the
+    remaining stock of every item.
+    """
+    quantities = {}
+    for item_id, quantity in lines:
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+
+    items = Item.objects.in_bulk(quantities)
+    for item_id in quantities:
+        if item_id not in items:
+            raise CheckoutError(f'Item {item_id} can\'t be found!')
+        if items[item_id].is_with_prescription:
+            raise CheckoutError(f'{items[item_id].name} is with prescription and can\'t be bought online!')
+
+    orders = []
+    remaining = {}
+    with transaction.atomic():
+        # Take stock in a stable order so two overlapping carts can't deadlock each other
+        for item_id in sorted(quantities):
+            item = items[item_id]
+            quantity = quantities[item_id]
+            remaining[item_id] = decrement_stock(item, quantity)
+            if remaining[item_id] is None:
+                raise CheckoutError(f'Not enough of {item.name}. Currently available - {available_stock(item)}!')
+            orders.append(Order(item=item, user=user, quantity=quantity, total_price=quantity * item.price))
+        create_orders(orders)
+
+    return orders, remaining
@@ -0,0 +1,91 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class OrderKeysetPagination(BasePagination):
+    """
+    Pages orders newest first by seeking past the last (order_date, id) of the previous page, so every page
+    is one range read on the (user, order_date, id) index however deep the client scrolls. Requests without
+    `cursor` or `page_size` are left unpaginated.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        params = request.query_params
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-order_date', '-id')
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            order_date, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(order_date__lt=order_date) | Q(order_date=order_date, id__lt=pk))
+
+        # One row past the page tells whether there is a next page without a COUNT
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, order):
+        position = f'{order.order_date.isoformat()}|{order.pk}'
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            order_date, pk = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            order_date = parse_datetime(order_date)
+            pk = int(pk)
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if order_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return order_date, pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
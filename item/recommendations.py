@@ -0,0 +1,85 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Item, ItemRecommendation, Order
+from .orders import ANONYMOUS_EMAIL
+
+RECOMMENDATIONS_PER_ITEM = getattr(settings, 'RECOMMENDATIONS_PER_ITEM', 3)
+# `stock` rather than the quantity column, which is 0 for items whose stock lives in shards
+RELATED_ITEM_FIELDS = ['id', 'name', 'category', 'price', 'stock', 'is_with_prescription']
+
+
+def co_purchase_counts():
+    """
+    Counts, for every pair of items, how many customers bought both. Anonymous purchases all share one
+    account, so they say nothing about what goes together and are left out.
+    """
+    baskets = defaultdict(set)
+    purchases = Order.objects.exclude(user=ANONYMOUS_EMAIL).values_list('user_id', 'item_id').distinct()
+    for user_id, item_id in purchases.iterator():
+        baskets[user_id].add(item_id)
+
+    counts = defaultdict(Counter)
+    for basket in baskets.values():
+        for item_id in basket:
+            for other_id in basket:
+                if other_id != item_id:
+                    counts[item_id][other_id] += 1
+    return counts
+
+
+def compute_recommendations(limit=RECOMMENDATIONS_PER_ITEM):
+    """
+    Rebuilds the recommendation table: items most often bought together first, topped up with the
+    best-selling items of the same category.
+    """
+    counts = co_purchase_counts()
+    units_sold = dict(Order.objects.values_list('item_id').annotate(units=Sum('quantity')))
+
+    by_category = defaultdict(list)
+    for item_id, category_id in Item.objects.values_list('id', 'category_id'):
+        by_category[category_id].append(item_id)
+    for item_ids in by_category.values():
+        item_ids.sort(key=lambda item_id: (-units_sold.get(item_id, 0), item_id))
+
+    recommendations = []
+    for category_id, item_ids in by_category.items():
+        for item_id in item_ids:
+            picks = [(other_id, count, ItemRecommendation.CO_PURCHASE)
+                     for other_id, count in counts[item_id].most_common(limit)]
+            chosen = {item_id} | {other_id for other_id, _, _ in picks}
+            for other_id in item_ids:
+                if len(picks) == limit:
+                    break
+                if other_id not in chosen:
+                    picks.append((other_id, units_sold.get(other_id, 0), ItemRecommendation.CATEGORY))
+
+            recommendations.extend(
+                ItemRecommendation(item_id=item_id, recommended_id=other_id, rank=rank, score=score, kind=kind)
+                for rank, (other_id, score, kind) in enumerate(picks)
+            )
+
+    with transaction.atomic():
+        ItemRecommendation.objects.all().delete()
+        ItemRecommendation.objects.bulk_create(recommendations, batch_size=1000)
+    return len(recommendations)
+
+
+def related_items(item, limit=RECOMMENDATIONS_PER_ITEM):
+    """
+    Returns the precomputed recommendations of an item as plain dicts, falling back to other items of
+    the same category for items added since the table was last computed.
+    """
+    rows = list(
+        Item.objects.with_stock().filter(recommended_in__item=item).order_by('recommended_in__rank')
+        .values(*RELATED_ITEM_FIELDS)[:limit]
+    )
+    if rows:
+        return rows
+    return list(
+        Item.objects.with_stock().filter(category_id=item.category_id).exclude(pk=item.pk)
+        .values(*RELATED_ITEM_FIELDS)[:limit]
+    )
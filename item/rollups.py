@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedOrder, DailyCategorySales, DailyItemSales, DailySales, Order
+
+
+def add_to_rollup(model, lookup, revenue, units, orders):
+    """
+    Adds to the counters of the rollup row matching `lookup`, creating it on the first sale of the day.
+    """
+    changes = {'revenue': F('revenue') + revenue, 'units': F('units') + units, 'orders': F('orders') + orders}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, revenue=revenue, units=units, orders=orders)
+    except IntegrityError:
+        # Another transaction created the row first
+        model.objects.filter(**lookup).update(**changes)
+
+
+def lock_for_rebuild(*models):
+    """
+    Blocks writers of `models` until the end of the transaction, so a rebuild that reads the orders and
+    then replaces the counters can't drop an order placed in between. SQLite serializes writers anyway and
+    fails the rebuild's write instead of losing one.
+    """
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in models)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {tables} IN EXCLUSIVE MODE')
+
+
+def group_sales(rows):
+    """
+    Folds (day, category_id, item_id, revenue, units, orders) rows into the totals of every rollup row.
+    """
+    totals = {DailySales: {}, DailyCategorySales: {}, DailyItemSales: {}}
+    for day, category_id, item_id, revenue, units, orders in rows:
+        for model, key in ((DailySales, (day,)), (DailyCategorySales, (day, category_id)),
+                           (DailyItemSales, (day, item_id))):
+            current = totals[model].get(key, (0, 0, 0))
+            totals[model][key] = (current[0] + revenue, current[1] + units, current[2] + orders)
+    return totals
+
+
+def rollup_lookup(model, key):
+    if model is DailySales:
+        return {'day': key[0]}
+    if model is DailyCategorySales:
+        return {'day': key[0], 'category_id': key[1]}
+    return {'day': key[0], 'item_id': key[1]}
+
+
+def record_sales(orders, sign=1):
+    """
+    Adds `orders` to the daily rollups, or takes them out again with `sign=-1`. Runs in the caller's
+    transaction, so the rollups never count an order that was rolled back.
+    """
+    rows = [
+        (timezone.localdate(order.order_date), order.item.category_id, order.item_id,
+         sign * Decimal(str(order.total_price)), sign * order.quantity, sign)
+        for order in orders
+    ]
+    with transaction.atomic():
+        for model, grouped in group_sales(rows).items():
+            for key, (revenue, units, count) in grouped.items():
+                add_to_rollup(model, rollup_lookup(model, key), revenue, units, count)
+
+
+def rebuild_rollups():
+    """
+    Recomputes every rollup from the hot and archived orders, for backfills and after orders were edited.
+    Returns the number of days with sales.
+    """
+    with transaction.atomic():
+        lock_for_rebuild(DailySales, DailyCategorySales, DailyItemSales)
+        rows = []
+        for orders in (Order.objects.all(), ArchivedOrder.objects.all()):
+            grouped = orders.annotate(day=TruncDate('order_date')).values('day', 'item__category', 'item_id') \
+                .annotate(revenue=Sum('total_price'), units=Sum('quantity'), orders=Count('id')).order_by()
+            rows += [(row['day'], row['item__category'], row['item_id'], row['revenue'], row['units'],
+                      row['orders']) for row in grouped.iterator()]
+
+        for model, grouped in group_sales(rows).items():
+            model.objects.all().delete()
+            model.objects.bulk_create(
+                (model(**rollup_lookup(model, key), revenue=revenue, units=units, orders=count)
+                 for key, (revenue, units, count) in grouped.items()),
+                batch_size=1000,
+            )
+    return DailySales.objects.count()
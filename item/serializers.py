@@ -1,6 +1,10 @@
+from django.db import transaction
 from rest_framework import serializers
 
-from .models import Item, Category, Order
+from .ledger import record_movement
+from .models import Item, Category, Order, StockMovement, AccountOrderSummary
+from .stock import available_stock, set_stock
+from .thumbnails import thumbnail_urls
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -10,15 +14,52 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class ItemSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Item
-        fields = '__all__'
+        exclude = ['image_hash', 'stock_shard_count']
+
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['quantity'] = instance.available_quantity
+        return data
+
+    def create(self, validated_data):
+        item = super().create(validated_data)
+        record_movement(item.pk, item.quantity, StockMovement.STAFF_EDIT)
+        return item
+
+    def update(self, instance, validated_data):
+        if 'quantity' not in validated_data:
+            return super().update(instance, validated_data)
+
+        with transaction.atomic():
+            current = available_stock(instance, for_update=True)
+            record_movement(instance.pk, validated_data['quantity'] - current, StockMovement.STAFF_EDIT)
+            if instance.stock_shard_count:
+                set_stock(instance, validated_data.pop('quantity'))
+            return super().update(instance, validated_data)
 
 
 class OrderSerializer(serializers.ModelSerializer):
+    # The email is the foreign key value itself, no need to load the account
+    user = serializers.CharField(source='user_id', read_only=True)
+
     class Meta:
         model = Order
-        fields = ['item', 'user', 'total_price', 'quantity', 'order_date']
+        fields = ['item', 'item_name', 'unit_price', 'user', 'total_price', 'quantity', 'order_date']
+
+
+class AccountOrderSummarySerializer(serializers.ModelSerializer):
+    email = serializers.CharField(source='account.email', read_only=True)
+
+    class Meta:
+        model = AccountOrderSummary
+        fields = ['email', 'order_count', 'total_spent', 'last_order_date']
 
 
 class BusinessStatisticsSerializer(serializers.Serializer):
@@ -27,3 +68,44 @@ class BusinessStatisticsSerializer(serializers.Serializer):
     revenue_by_category = serializers.DictField(child=serializers.DecimalField(max_digits=10, decimal_places=2))
     average_order_value = serializers.DecimalField(max_digits=10, decimal_places=2)
     top_selling_products = serializers.ListField(child=serializers.DictField())
+    query_timings = serializers.DictField(child=serializers.FloatField(), required=False)
+    series = serializers.DictField(required=False)
+
+
+class ItemBulkRowSerializer(serializers.ModelSerializer):
+    """
+    Validates one row of a bulk upsert. Rows with an `id` update that item and may be partial, rows without
+    one create a new item. Categories are plain ids here and are checked for the whole batch at once.
+    """
+    id = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Item
+        fields = ['id', 'category', 'name', 'description', 'price', 'quantity', 'is_with_prescription']
+
+    def validate(self, attrs):
+        if 'id' not in attrs:
+            missing = {field: 'This field is required.' for field in ('category', 'name', 'price')
+                       if field not in attrs}
+            if missing:
+                raise serializers.ValidationError(missing)
+        return attrs
+
+
+class CheckoutLineSerializer(serializers.Serializer):
+    item_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    items = CheckoutLineSerializer(many=True, allow_empty=False)
+
+
+class RelatedItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    category = serializers.IntegerField()
+    price = serializers.FloatField()
+    quantity = serializers.IntegerField(source='stock')
+    is_with_prescription = serializers.BooleanField()
@@ -0,0 +1,88 @@
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+
+# Sent once per write batch (bulk upsert, catalog import) rather than once per item, so receivers that
+# drop cached catalog data do it a single time. Provides `item_ids`, which is None when the batch was too
+# large to track and the whole catalog should be treated as changed.
+catalog_changed = Signal()
+
+# Sent inside the inserting transaction after new orders are stored, with `orders`. Bulk inserts send it once
+# for the whole batch, single saves are bridged from post_save.
+orders_placed = Signal()
+
+# True while archive_order_batches deletes the orders it copied. Archived orders still count as sales, so the
+# post_delete receivers leave the counters alone.
+archiving_orders = ContextVar('archiving_orders', default=False)
+
+
+@receiver(pre_save, sender='item.Item')
+def mark_new_image(sender, instance, **kwargs):
+    if not instance.image:
+        instance.image_hash = ''
+    elif not instance.image._committed:
+        instance.image_hash = ''
+        instance._image_uploaded = True
+
+
+@receiver(post_save, sender='item.Item')
+def schedule_item_thumbnails(sender, instance, **kwargs):
+    if getattr(instance, '_image_uploaded', False):
+        instance._image_uploaded = False
+        from .thumbnails import schedule_thumbnails
+        transaction.on_commit(lambda: schedule_thumbnails(instance.pk))
+
+
+@receiver(catalog_changed)
+def expire_cached_statistics(sender, **kwargs):
+    # Cached statistics name items and categories, which the batch may have renamed
+    from .statistics_cache import expire_statistics
+    expire_statistics()
+
+
+@receiver(post_save, sender='item.Order')
+def announce_saved_order(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        orders_placed.send(sender=sender, orders=[instance])
+
+
+@receiver(orders_placed)
+def add_orders_to_rollups(sender, orders, **kwargs):
+    from .rollups import record_sales
+    record_sales(orders)
+
+
+@receiver(orders_placed)
+def add_orders_to_sketches(sender, orders, **kwargs):
+    from .sketches import record_purchases
+    record_purchases(orders)
+
+
+@receiver(orders_placed)
+def add_orders_to_cohorts(sender, orders, **kwargs):
+    from .cohorts import record_activity
+    record_activity(orders)
+
+
+@receiver(orders_placed)
+def add_orders_to_summaries(sender, orders, **kwargs):
+    from .summaries import record_order_totals
+    record_order_totals(orders)
+
+
+@receiver(post_delete, sender='item.Order')
+def remove_order_from_rollups(sender, instance, **kwargs):
+    if archiving_orders.get():
+        return
+    from .rollups import record_sales
+    record_sales([instance], sign=-1)
+
+
+@receiver(post_delete, sender='item.Order')
+def remove_order_from_summaries(sender, instance, **kwargs):
+    if archiving_orders.get():
+        return
+    from .summaries import record_order_totals
+    record_order_totals([instance], sign=-1)
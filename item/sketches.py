@@ -0,0 +1,253 @@
+import hashlib
+import heapq
+import math
+import struct
+import zlib
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import AnalyticsSketch, SketchEvent
+
+HLL_PRECISION = 12
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+SKETCH_TOP_K = 20
+ITEM_BUCKET_MINUTES = 5
+SKETCH_FOLD_BATCH_SIZE = 5000
+
+
+def hash_value(value, size=8):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=size).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct values added, within about 1.6% at the default precision, in
+    2^precision bytes. Two sketches of the same precision merge into the sketch of the union.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, value):
+        hashed = hash_value(value)
+        index = hashed >> (64 - self.precision)
+        rest = (hashed << self.precision) & (2 ** 64 - 1)
+        rank = 64 - rest.bit_length() + 1 if rest else 64 - self.precision + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / np.sum(np.power(2.0, -self.registers.astype(float)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * size and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+    def to_bytes(self):
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy()
+        return cls(precision=len(registers).bit_length() - 1, registers=registers)
+
+
+class CountMinSketch:
+    """
+    Approximate counts of integer keys that never undercount, plus the `top_k` keys with the highest
+    estimates seen so far. Sketches of the same shape merge by adding their counters.
+    """
+
+    def __init__(self, width=CMS_WIDTH, depth=CMS_DEPTH, top_k=SKETCH_TOP_K, counts=None, heavy=None):
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.counts = np.zeros((depth, width), dtype=np.uint32) if counts is None else counts
+        self.heavy = heavy or {}
+
+    def columns(self, key):
+        hashed = hash_value(key, size=16)
+        first, second = hashed >> 64, hashed & (2 ** 64 - 1)
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        self.counts[np.arange(self.depth), self.columns(key)] += count
+        self.keep_heaviest(set(self.heavy) | {key})
+
+    def estimate(self, key):
+        return int(self.counts[np.arange(self.depth), self.columns(key)].min())
+
+    def keep_heaviest(self, keys):
+        self.heavy = dict(heapq.nlargest(self.top_k, ((key, self.estimate(key)) for key in keys), key=itemgetter(1)))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.keep_heaviest(set(self.heavy) | set(other.heavy))
+        return self
+
+    def top(self, count):
+        return heapq.nlargest(count, self.heavy.items(), key=itemgetter(1))
+
+    def to_bytes(self):
+        heavy = np.array(list(self.heavy.items()), dtype='<i8').reshape(-1, 2)
+        header = struct.pack('<HHHH', self.depth, self.width, self.top_k, len(heavy))
+        return zlib.compress(header + heavy.tobytes() + self.counts.astype('<u4').tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(data)
+        depth, width, top_k, heavy_count = struct.unpack_from('<HHHH', data)
+        offset = struct.calcsize('<HHHH')
+        heavy = np.frombuffer(data, dtype='<i8', count=heavy_count * 2, offset=offset).reshape(-1, 2)
+        counts = np.frombuffer(data, dtype='<u4', offset=offset + heavy.nbytes).reshape(depth, width)
+        return cls(width, depth, top_k, counts.astype(np.uint32), {int(key): int(value) for key, value in heavy})
+
+
+SKETCH_TYPES = {
+    AnalyticsSketch.BUYERS: HyperLogLog,
+    AnalyticsSketch.ITEMS: CountMinSketch,
+}
+
+
+def bucket_start(kind, moment):
+    """
+    Buyers are counted per day and items per few minutes, so both can be merged over the windows asked for.
+    """
+    moment = timezone.localtime(moment)
+    if kind == AnalyticsSketch.BUYERS:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=moment.minute - moment.minute % ITEM_BUCKET_MINUTES, second=0, microsecond=0)
+
+
+def update_sketch(kind, start, additions):
+    """
+    Applies `additions`, argument tuples for the sketch's add(), to the stored sketch of one bucket.
+    """
+    with transaction.atomic():
+        row, _ = AnalyticsSketch.objects.select_for_update().get_or_create(kind=kind, bucket_start=start)
+        sketch = SKETCH_TYPES[kind].from_bytes(row.data) if row.data else SKETCH_TYPES[kind]()
+        for arguments in additions:
+            sketch.add(*arguments)
+        row.data = sketch.to_bytes()
+        row.save(update_fields=['data'])
+
+
+def record_purchases(orders):
+    """
+    Queues orders for the buyer and item sketches. The anonymous checkout account is not a customer and
+    isn't counted as a buyer.
+    """
+    from .orders import ANONYMOUS_EMAIL
+
+    SketchEvent.objects.bulk_create(
+        SketchEvent(order_date=order.order_date, buyer='' if order.user_id == ANONYMOUS_EMAIL else order.user_id,
+                    item_id=order.item_id, quantity=order.quantity)
+        for order in orders
+    )
+
+
+def fold_sketch_events(batch_size=SKETCH_FOLD_BATCH_SIZE):
+    """
+    Applies queued purchases to the sketches of their buckets, oldest first, and yields the size of every
+    batch. Each batch is applied and deleted in one transaction, so an interrupted run can simply be started
+    again, and concurrent runs skip each other's rows where the database supports it.
+    """
+    while True:
+        with transaction.atomic():
+            events = SketchEvent.objects.order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                events = events.select_for_update(skip_locked=True)
+            events = list(events[:batch_size])
+            if not events:
+                return
+
+            buyers = {}
+            items = {}
+            for event in events:
+                if event.buyer:
+                    buyers.setdefault(bucket_start(AnalyticsSketch.BUYERS, event.order_date), set()).add(event.buyer)
+                bucket = items.setdefault(bucket_start(AnalyticsSketch.ITEMS, event.order_date), {})
+                bucket[event.item_id] = bucket.get(event.item_id, 0) + event.quantity
+
+            for start, emails in buyers.items():
+                update_sketch(AnalyticsSketch.BUYERS, start, [(email,) for email in emails])
+            for start, quantities in items.items():
+                update_sketch(AnalyticsSketch.ITEMS, start, quantities.items())
+            SketchEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+        yield len(events)
+
+
+def purge_old_sketches(now=None):
+    """
+    Deletes item buckets older than SKETCH_ITEM_RETENTION_DAYS and buyer buckets older than
+    SKETCH_BUYER_RETENTION_DAYS, and returns how many were deleted.
+    """
+    now = now or timezone.now()
+    retention = {
+        AnalyticsSketch.ITEMS: settings.SKETCH_ITEM_RETENTION_DAYS,
+        AnalyticsSketch.BUYERS: settings.SKETCH_BUYER_RETENTION_DAYS,
+    }
+    return sum(
+        AnalyticsSketch.objects.filter(kind=kind, bucket_start__lt=now - timedelta(days=days)).delete()[0]
+        for kind, days in retention.items()
+    )
+
+
+def merged_sketch(kind, since, until=None):
+    """
+    Merges every bucket of `kind` that starts at or after the bucket containing `since`, together with the
+    purchases still queued for fold_sketches, so the figures are live without waiting for the next fold.
+    Queued purchases are read first: one folded in between is then counted twice at worst, never missed.
+    """
+    start = bucket_start(kind, since)
+    sketch = SKETCH_TYPES[kind]()
+    with transaction.atomic():
+        events = SketchEvent.objects.filter(order_date__gte=start)
+        if until:
+            events = events.filter(order_date__lt=until)
+        if kind == AnalyticsSketch.BUYERS:
+            for buyer in events.exclude(buyer='').values_list('buyer', flat=True).distinct().iterator():
+                sketch.add(buyer)
+        else:
+            for item_id, quantity in events.values_list('item_id').annotate(units=Sum('quantity')).order_by():
+                sketch.add(item_id, quantity)
+
+        rows = AnalyticsSketch.objects.filter(kind=kind, bucket_start__gte=start)
+        if until:
+            rows = rows.filter(bucket_start__lt=until)
+        for data in rows.values_list('data', flat=True).iterator():
+            sketch.merge(SKETCH_TYPES[kind].from_bytes(data))
+    return sketch
+
+
+def distinct_buyers(since):
+    return merged_sketch(AnalyticsSketch.BUYERS, since).count()
+
+
+def top_items(since, count):
+    return merged_sketch(AnalyticsSketch.ITEMS, since).top(count)
+
+
+def start_of_month(moment=None):
+    today = timezone.localdate(moment)
+    return timezone.make_aware(datetime(today.year, today.month, 1))
+
+
+def start_of_day(moment=None):
+    today = timezone.localdate(moment)
+    return timezone.make_aware(datetime(today.year, today.month, today.day))
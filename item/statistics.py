@@ -0,0 +1,64 @@
+import time
+
+from django.db.models import Sum
+
+from .models import DailyCategorySales, DailyItemSales, DailySales
+
+TOP_SELLING_PRODUCTS = 5
+
+
+def timed(timings, name, query):
+    """
+    Calls `query` and records how long it took in milliseconds under `name`.
+    """
+    started = time.perf_counter()
+    result = query()
+    timings[name] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def in_period(rollups, start=None, end=None):
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+    return rollups
+
+
+def revenue_by_category(start=None, end=None):
+    return in_period(DailyCategorySales.objects, start, end).values('category').annotate(
+        total_revenue=Sum('revenue'), total_orders=Sum('orders'),
+    ).filter(total_orders__gt=0).order_by()
+
+
+def top_selling_products(start=None, end=None, limit=TOP_SELLING_PRODUCTS):
+    return in_period(DailyItemSales.objects, start, end).values('item_id', 'item__name').annotate(
+        total_quantity=Sum('units'),
+    ).filter(total_quantity__gt=0).order_by('-total_quantity')[:limit]
+
+
+def business_statistics(start=None, end=None):
+    """
+    Reads the dashboard figures from the daily sales rollups, so the cost follows the number of days,
+    categories and items rather than the number of orders. Rows whose orders were all deleted are skipped.
+    `start` and `end` limit the figures to the days between them, inclusive.
+    """
+    timings = {}
+    totals = timed(timings, 'totals', lambda: in_period(DailySales.objects, start, end).aggregate(
+        revenue=Sum('revenue'), orders=Sum('orders')))
+    categories = timed(timings, 'revenue_by_category', lambda: list(revenue_by_category(start, end)))
+    products = timed(timings, 'top_selling_products', lambda: list(top_selling_products(start, end)))
+
+    total_sales = totals['revenue'] or 0
+    total_orders = totals['orders'] or 0
+    return {
+        'total_sales': total_sales,
+        'total_orders': total_orders,
+        'revenue_by_category': {row['category']: row['total_revenue'] for row in categories},
+        'average_order_value': total_sales / total_orders if total_orders else 0,
+        'top_selling_products': [
+            {'id': row['item_id'], 'name': row['item__name'], 'total_quantity': row['total_quantity']}
+            for row in products
+        ],
+        'query_timings': timings,
+    }
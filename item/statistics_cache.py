@@ -0,0 +1,69 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+CACHE_PREFIX = 'business-statistics'
+# Part of every key, bumping it makes all cached statistics miss at once
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+# A refresh that hasn't finished by then is assumed dead and another one may start
+REFRESH_LOCK_SECONDS = 300
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='statistics')
+
+
+def cache_keys(params):
+    generation = cache.get_or_set(GENERATION_KEY, 0, timeout=None)
+    digest = hashlib.sha256(repr(params).encode()).hexdigest()[:16]
+    return f'{CACHE_PREFIX}:{generation}:{digest}', f'{CACHE_PREFIX}:{generation}:{digest}:refreshing'
+
+
+def expire_statistics():
+    """
+    Drops every cached statistics entry, so the next request recomputes it.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
+
+
+def refresh(key, compute):
+    entry = {'data': compute(), 'as_of': timezone.now()}
+    cache.set(key, entry, timeout=getattr(settings, 'STATISTICS_CACHE_TIMEOUT', None))
+    return entry
+
+
+def _refresh_in_background(key, lock_key, compute):
+    try:
+        refresh(key, compute)
+    finally:
+        cache.delete(lock_key)
+        close_old_connections()
+
+
+def cached_statistics(params, compute, force=False):
+    """
+    Returns {'data': ..., 'as_of': ...} for the statistics described by `params`. A cached entry is served
+    as is. Once it is older than STATISTICS_FRESH_SECONDS, one background refresh is started and the stale
+    entry is still served. Only a missing entry or `force` is computed during the request.
+    """
+    key, lock_key = cache_keys(params)
+    entry = None if force else cache.get(key)
+    if entry is None:
+        return refresh(key, compute)
+
+    fresh_for = timedelta(seconds=getattr(settings, 'STATISTICS_FRESH_SECONDS', 60))
+    if timezone.now() - entry['as_of'] > fresh_for and cache.add(lock_key, True, timeout=REFRESH_LOCK_SECONDS):
+        if getattr(settings, 'STATISTICS_REFRESH_ASYNC', True):
+            executor.submit(_refresh_in_background, key, lock_key, compute)
+        else:
+            try:
+                refresh(key, compute)
+            finally:
+                cache.delete(lock_key)
+    return entry
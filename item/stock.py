@@ -0,0 +1,144 @@
+import random
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from .ledger import record_movement
+from .models import Item, StockMovement, StockShard
+
+
+def update_returning_supported():
+    # PostgreSQL and SQLite 3.35+ have UPDATE ... RETURNING. MariaDB only has it on INSERT and DELETE, even
+    # though Django reports can_return_columns_from_insert there.
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def conditional_decrement(model, quantity, **lookup):
+    """
+    Subtracts `quantity` from the row matching `lookup` only if it has at least that much, in a single
+    UPDATE. Returns the row's new quantity, or None if it didn't have enough. Must run inside a transaction.
+    """
+    if update_returning_supported():
+        quote = connection.ops.quote_name
+        where = ' AND '.join(f'{quote(model._meta.get_field(field).column)} = %s' for field in lookup)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote(model._meta.db_table)} SET quantity = quantity - %s '
+                f'WHERE {where} AND quantity >= %s RETURNING quantity',
+                [quantity, *lookup.values(), quantity],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    # The UPDATE keeps the row locked until the end of the transaction, so the read after it is still ours
+    if not model.objects.filter(quantity__gte=quantity, **lookup).update(quantity=F('quantity') - quantity):
+        return None
+    return model.objects.filter(**lookup).values_list('quantity', flat=True).get()
+
+
+def decrement_stock(item, quantity):
+    """
+    Takes `quantity` units of an item so concurrent buyers can never oversell, and records the purchase
+    in the stock ledger. Returns the remaining stock, or None if there was not enough. Must run inside a
+    transaction.
+    """
+    remaining = take_stock(item, quantity)
+    if remaining is not None:
+        record_movement(item.pk, -quantity, StockMovement.PURCHASE)
+    return remaining
+
+
+def take_stock(item, quantity):
+    if not item.stock_shard_count:
+        return conditional_decrement(Item, quantity, id=item.pk)
+
+    # Start at a random shard so concurrent buyers spread out, and move on to the others if it runs dry
+    start = random.randrange(item.stock_shard_count)
+    for offset in range(item.stock_shard_count):
+        number = (start + offset) % item.stock_shard_count
+        if conditional_decrement(StockShard, quantity, item_id=item.pk, number=number) is not None:
+            return shard_total(item)
+
+    # No single shard has enough, take it from several at once under a lock
+    shards = list(StockShard.objects.select_for_update().filter(item=item).order_by('number'))
+    total = sum(shard.quantity for shard in shards)
+    if total < quantity:
+        return None
+    needed = quantity
+    for shard in shards:
+        taken = min(shard.quantity, needed)
+        shard.quantity -= taken
+        needed -= taken
+    StockShard.objects.bulk_update(shards, ['quantity'])
+    return total - quantity
+
+
+def shard_total(item):
+    return StockShard.objects.filter(item=item).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def available_stock(item, for_update=False):
+    """
+    Reads the current stock of an item. With `for_update` the rows are locked until the end of the
+    transaction, for callers that are about to overwrite the stock.
+    """
+    model, lookup = (StockShard, {'item': item}) if item.stock_shard_count else (Item, {'pk': item.pk})
+    rows = model.objects.filter(**lookup)
+    if for_update:
+        rows = rows.select_for_update()
+    return sum(rows.values_list('quantity', flat=True))
+
+
+def split_evenly(total, parts):
+    return [total // parts + (1 if number < total % parts else 0) for number in range(parts)]
+
+
+def set_shard_count(item, shards):
+    """
+    Moves an item's stock into `shards` counter rows, or back into Item.quantity when `shards` is 0.
+    """
+    with transaction.atomic():
+        item = Item.objects.select_for_update().get(pk=item.pk)
+        total = available_stock(item)
+        StockShard.objects.filter(item=item).delete()
+        StockShard.objects.bulk_create(
+            StockShard(item=item, number=number, quantity=quantity)
+            for number, quantity in enumerate(split_evenly(total, shards) if shards else [])
+        )
+        item.stock_shard_count = shards
+        item.quantity = 0 if shards else total
+        item.save(update_fields=['stock_shard_count', 'quantity'])
+    return item
+
+
+def spread_over_shards(item, quantity=None):
+    """
+    Redistributes `quantity` (by default the current total) evenly over the item's shards.
+    """
+    with transaction.atomic():
+        shards = list(StockShard.objects.select_for_update().filter(item=item).order_by('number'))
+        if quantity is None:
+            quantity = sum(shard.quantity for shard in shards)
+        for shard, shard_quantity in zip(shards, split_evenly(quantity, len(shards))):
+            shard.quantity = shard_quantity
+        StockShard.objects.bulk_update(shards, ['quantity'])
+    return quantity
+
+
+def set_stock(item, quantity):
+    """
+    Sets the absolute stock of an item, spreading it over the shards of sharded items.
+    """
+    if item.stock_shard_count:
+        spread_over_shards(item, quantity)
+    else:
+        Item.objects.filter(pk=item.pk).update(quantity=quantity)
+
+
+def rebalance_shards(item):
+    """
+    Evens out the shards of an item, so random picks keep finding stock until the item is sold out.
+    """
+    return spread_over_shards(item)
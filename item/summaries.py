@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateTimeField, F, Max, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AccountOrderSummary, ArchivedOrder, Order
+from .orders import ANONYMOUS_EMAIL
+
+SUMMARY_BATCH_SIZE = 500
+
+
+def add_to_summary(account_id, orders, spent, last_order_date):
+    changes = {'order_count': F('order_count') + orders, 'total_spent': F('total_spent') + spent}
+    if last_order_date:
+        last = Value(last_order_date, output_field=DateTimeField())
+        changes['last_order_date'] = Greatest(Coalesce('last_order_date', last), last)
+    if AccountOrderSummary.objects.filter(account_id=account_id).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            AccountOrderSummary.objects.create(account_id=account_id, order_count=orders, total_spent=spent,
+                                               last_order_date=last_order_date)
+    except IntegrityError:
+        AccountOrderSummary.objects.filter(account_id=account_id).update(**changes)
+
+
+def record_order_totals(orders, sign=1):
+    """
+    Adds `orders` to their accounts' summaries, or takes them out again with `sign=-1`. The last order date
+    only ever moves forward, deleting an order leaves it for the repair command. The anonymous checkout
+    account is not a customer and gets no summary.
+    """
+    totals = {}
+    for order in orders:
+        if order.user_id == ANONYMOUS_EMAIL:
+            continue
+        count, spent, last = totals.get(order.user.pk, (0, 0, None))
+        totals[order.user.pk] = (count + sign, spent + sign * Decimal(str(order.total_price)),
+                                 max(last, order.order_date) if last else order.order_date)
+
+    with transaction.atomic():
+        for account_id in sorted(totals):
+            count, spent, last = totals[account_id]
+            add_to_summary(account_id, count, spent, last if sign > 0 else None)
+
+
+def repair_summaries(batch_size=SUMMARY_BATCH_SIZE):
+    """
+    Recomputes the summaries of all accounts with orders from the hot and archived orders, one batch of
+    accounts per transaction, and yields the size of every batch. A summary of the anonymous account is deleted.
+    """
+    accounts = get_user_model().objects.order_by('pk').values_list('pk', 'email')
+    last_pk = 0
+    while True:
+        batch = dict(accounts.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        last_pk = max(batch)
+        emails = {email: pk for pk, email in batch.items() if email != ANONYMOUS_EMAIL}
+
+        totals = {}
+        for orders in (Order.objects, ArchivedOrder.objects):
+            rows = orders.filter(user_id__in=emails).values('user_id').annotate(
+                count=Count('id'), spent=Sum('total_price'), last=Max('order_date')).order_by()
+            for row in rows:
+                count, spent, last = totals.get(emails[row['user_id']], (0, 0, None))
+                totals[emails[row['user_id']]] = (count + row['count'], spent + row['spent'],
+                                                  max(last, row['last']) if last else row['last'])
+
+        with transaction.atomic():
+            AccountOrderSummary.objects.filter(account_id__in=batch).exclude(account_id__in=totals).delete()
+            AccountOrderSummary.objects.bulk_create(
+                [AccountOrderSummary(account_id=account_id, order_count=count, total_spent=spent,
+                                     last_order_date=last)
+                 for account_id, (count, spent, last) in totals.items()],
+                update_conflicts=True, unique_fields=['account'],
+                update_fields=['order_count', 'total_spent', 'last_order_date'],
+            )
+        yield len(batch)
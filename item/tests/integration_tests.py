@@ -1,14 +1,28 @@
+import json
+import tempfile
+from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APIRequestFactory
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.core.management import call_command, CommandError
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from django.contrib.auth import get_user_model
 
+from core.authentication import user_cache
 from core.models import Account
+from core.tokens import get_tokens_for_user
 from item.views import *
 from item.models import *
 from item.search import *
+from item.idempotency import request_scope
+from item.loadtest import run_load_test
+from item.stock import set_shard_count
 
 User = get_user_model()
 
@@ -308,9 +322,11 @@ class ItemIntegrationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+@override_settings(STATISTICS_REFRESH_ASYNC=False)
 class BusinessStatisticsIntegrationTests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.admin_user = User.objects.create_superuser(
             email='admin@example.com',
             password='adminpass',
@@ -347,6 +363,25 @@ class BusinessStatisticsIntegrationTests(APITestCase):
         self.assertEqual(len(data['top_selling_products']), 1)
         self.assertEqual(data['top_selling_products'][0]['name'], 'Item1')
 
+    def test_statistics_read_rollups(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(reverse('business-statistics')).json()
+        self.assertEqual(set(data['query_timings']), {'totals', 'revenue_by_category', 'top_selling_products'})
+        self.assertGreaterEqual(data['query_timings']['totals'], 0)
+
+    def test_statistics_include_archived_orders(self):
+        Order.objects.update(order_date=timezone.now() - timedelta(days=500))
+        call_command('archive_orders', stdout=StringIO())
+        Order.objects.create(item=Item.objects.get(name='Item1'), total_price=500.00, quantity=5, user=self.admin_user)
+
+        data = self.client.get(reverse('business-statistics')).json()
+
+        self.assertEqual(data['total_sales'], '1500.00')
+        self.assertEqual(data['total_orders'], 2)
+        self.assertEqual(data['revenue_by_category'][f'{self.category.id}'], '1500.00')
+        self.assertEqual(data['average_order_value'], '750.00')
+        self.assertEqual(data['top_selling_products'][0]['total_quantity'], 15)
+
     def test_no_orders(self):
         # Clear orders
         Order.objects.all().delete()
@@ -373,6 +408,119 @@ class BusinessStatisticsIntegrationTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_statistics_served_from_cache(self):
+        url = reverse('business-statistics')
+        first = self.client.get(url).json()
+        self.assertEqual(first['total_orders'], 1)
+        self.assertIn('as_of', first)
+
+        Order.objects.create(item=Item.objects.get(name='Item1'), total_price=100.00, quantity=1, user=self.admin_user)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url).json()
+        self.assertEqual(cached['total_orders'], 1)
+        self.assertEqual(cached['as_of'], first['as_of'])
+
+        fresh = self.client.get(url, {'fresh': 1}).json()
+        self.assertEqual(fresh['total_orders'], 2)
+        self.assertNotEqual(fresh['as_of'], first['as_of'])
+
+    def test_stale_statistics_are_served_while_refreshing(self):
+        url = reverse('business-statistics')
+        with override_settings(STATISTICS_FRESH_SECONDS=0):
+            first = self.client.get(url).json()
+            Order.objects.create(item=Item.objects.get(name='Item1'), total_price=100.00, quantity=1,
+                                 user=self.admin_user)
+
+            stale = self.client.get(url).json()
+            self.assertEqual(stale['total_orders'], 1)
+            self.assertEqual(stale['as_of'], first['as_of'])
+
+            refreshed = self.client.get(url).json()
+            self.assertEqual(refreshed['total_orders'], 2)
+
+    def test_live_statistics(self):
+        response = self.client.get(reverse('business-statistics-live'), {'minutes': 30, 'top': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['unique_customers_today'], 1)
+        self.assertEqual(data['unique_customers_this_month'], 1)
+        self.assertEqual(data['window_minutes'], 30)
+        self.assertEqual(data['top_items'], [{'id': Item.objects.get(name='Item1').id, 'name': 'Item1',
+                                              'estimated_quantity': 10}])
+
+        call_command('fold_sketches', stdout=StringIO())
+        folded = self.client.get(reverse('business-statistics-live'), {'minutes': 30, 'top': 3})
+        self.assertEqual(folded.json(), data)
+
+        response = self.client.get(reverse('business-statistics-live'), {'top': 1000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_order_analytics_endpoint(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(ORDER_SNAPSHOT_DIR=directory):
+            response = self.client.get(reverse('order-analytics'))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+            call_command('snapshot_orders', stdout=StringIO())
+            response = self.client.get(reverse('order-analytics'), {'bins': 5})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['orders'], 1)
+        self.assertEqual(data['unit_price']['percentiles']['p50'], 100.0)
+        self.assertEqual(len(data['unit_price']['histogram']['counts']), 5)
+        self.assertIsNotNone(data['as_of'])
+
+    def test_retention_endpoint(self):
+        response = self.client.get(reverse('retention'), {'months': 3})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        cohort = response.json()['cohorts'][0]
+        self.assertEqual(cohort['month'], timezone.localdate().strftime('%Y-%m'))
+        self.assertEqual(cohort['counts'], [1, 0, 0, 0])
+
+        response = self.client.get(reverse('retention'), {'from': 'last year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_statistics_time_series(self):
+        DailySales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+        DailyItemSales.objects.all().delete()
+        for day, revenue, orders in (('2024-01-01', 100, 2), ('2024-01-03', 50, 1), ('2024-01-09', 30, 3)):
+            DailySales.objects.create(day=day, revenue=revenue, units=orders, orders=orders)
+            DailyCategorySales.objects.create(day=day, category=self.category, revenue=revenue, units=orders,
+                                              orders=orders)
+
+        response = self.client.get(reverse('business-statistics'),
+                                   {'from': '2024-01-01', 'to': '2024-01-14', 'bucket': 'week', 'window': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data['total_sales'], '180.00')
+        self.assertEqual(data['total_orders'], 6)
+        self.assertEqual(data['series'], {
+            'bucket': 'week',
+            'periods': ['2024-01-01', '2024-01-08'],
+            'revenue': [150.0, 30.0],
+            'orders': [3, 3],
+            'average_order_value': [50.0, 10.0],
+            'revenue_moving_average': [150.0, 90.0],
+            'revenue_by_category': {str(self.category.id): [150.0, 30.0]},
+        })
+        self.assertIn('series', data['query_timings'])
+
+        response = self.client.get(reverse('business-statistics'), {'from': '2024-01-02', 'to': '2024-01-09'})
+        self.assertEqual(response.json()['total_sales'], '80.00')
+        self.assertEqual(len(response.json()['series']['periods']), 8)
+
+    def test_statistics_invalid_period(self):
+        url = reverse('business-statistics')
+        for params in ({'from': '2024-13-01'}, {'from': '2024-02-01', 'to': '2024-01-01'}, {'bucket': 'year'},
+                       {'window': 0}, {'from': '2000-01-01', 'to': '2024-01-01'}):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertIn('error', response.json())
+
 
 class ItemBuyIntegrationTests(APITestCase):
 
@@ -427,6 +575,7 @@ class ItemBuyIntegrationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['message'], "Bought 5 items for 50.0.")
         self.assertEqual(Item.objects.get(pk=self.item_with_stock.pk).quantity, 95)
+        self.assertEqual(response.data['remaining_quantity'], 95)
         self.assertTrue(Order.objects.filter(item=self.item_with_stock, user=self.user).exists())
 
     def test_buy_item_success_anonymous_user(self):
@@ -436,6 +585,44 @@ class ItemBuyIntegrationTests(APITestCase):
         self.assertEqual(Item.objects.get(pk=self.item_with_stock.pk).quantity, 95)
         self.assertTrue(Order.objects.filter(item=self.item_with_stock, user=self.anonymous_user).exists())
 
+    def test_buy_item_returns_related_items(self):
+        other = Item.objects.create(name="Other Item", category=self.category, price=1.0, quantity=1)
+        ItemRecommendation.objects.create(item=self.item_with_stock, recommended=other, rank=0,
+                                          kind=ItemRecommendation.CO_PURCHASE)
+
+        response = self.client.post(self.url, data={'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['related_items'], [{
+            'id': other.id, 'name': 'Other Item', 'category': self.category.id, 'price': 1.0, 'quantity': 1,
+            'is_with_prescription': False,
+        }])
+
+        other.quantity = 49
+        other.save()
+        set_shard_count(other, 4)
+        response = self.client.post(self.url, data={'quantity': 1})
+        self.assertEqual(response.data['related_items'][0]['quantity'], 49)
+
+    def test_buy_item_sold_out_by_previous_buyer(self):
+        response = self.client.post(self.url, data={'quantity': 60})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(self.url, data={'quantity': 60})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], "Not enough of the product. Currently available - 40!")
+        self.assertNotIn('remaining_quantity', response.data)
+        self.assertEqual(Item.objects.get(pk=self.item_with_stock.pk).quantity, 40)
+        self.assertEqual(Order.objects.filter(item=self.item_with_stock).count(), 1)
+
+    def test_buy_sharded_item(self):
+        set_shard_count(self.item_with_stock, 4)
+        response = self.client.post(self.url, data={'quantity': 30})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['remaining_quantity'], 70)
+
+        response = self.client.get(reverse('item-detail', args=[self.item_with_stock.pk]))
+        self.assertEqual(response.data['quantity'], 70)
+
     def test_buy_item_zero_quantity(self):
         response = self.client.post(self.url, data={'quantity': 0})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -556,3 +743,399 @@ class OrderListIntegrationTests(APITestCase):
         serializer = OrderSerializer(orders, many=True)
         self.assertEqual(response.data, serializer.data)
         self.assertEqual(len(response.data), 1)
+
+    def test_order_list_keyset_pages(self):
+        for _ in range(3):
+            Order.objects.create(item=self.item1, user=self.user, total_price=10.00, quantity=1)
+        self.client.force_authenticate(user=self.user)
+        orders = Order.objects.filter(user=self.user).order_by('-order_date', '-id')
+
+        seen = []
+        response = self.client.get(self.url, {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += response.data['results']
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(seen, OrderSerializer(orders, many=True).data)
+
+    def test_order_list_page_renders_from_snapshots(self):
+        self.client.force_authenticate(user=self.user)
+        # The page is full from the hot table, so the archive isn't read either
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'page_size': 1})
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(response.data['results'][0]['item_name'], 'Test Item 2')
+        self.assertEqual(response.data['results'][0]['unit_price'], '20.00')
+
+        # A short last page runs out of hot orders and continues into the archive with one more query
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'page_size': 10})
+        self.assertIsNone(response.data['next'])
+        self.assertEqual([order['item_name'] for order in response.data['results']], ['Test Item 2', 'Test Item 1'])
+
+    def test_order_list_reads_through_archive(self):
+        Order.objects.filter(pk=self.order1.pk).update(order_date=self.order1.order_date - timedelta(days=500))
+        call_command('archive_orders', stdout=StringIO())
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.order1.pk).exists())
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.url, {'page_size': 1})
+        self.assertEqual(response.data['results'][0]['total_price'], '200.00')
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][0]['total_price'], '100.00')
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(self.url)
+        self.assertEqual([order['total_price'] for order in response.data], ['200.00', '100.00'])
+        response = self.client.get(self.url, {'order_date_after': timezone.now() - timedelta(days=1)})
+        self.assertEqual(len(response.data), 1)
+
+    def test_order_list_falls_back_to_email_before_backfill(self):
+        Order.objects.filter(pk=self.order1.pk).update(account=None)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(self.url)
+        self.assertEqual([order['total_price'] for order in response.data], ['200.00', '100.00'])
+
+        with override_settings(ORDER_READS_BY_ACCOUNT=True):
+            response = self.client.get(self.url)
+        self.assertEqual([order['total_price'] for order in response.data], ['200.00'])
+
+    def test_order_list_with_token(self):
+        user_cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {get_tokens_for_user(self.user)["access"]}')
+
+        response = self.client.get(self.url)
+        self.assertEqual([order['total_price'] for order in response.data], ['200.00', '100.00'])
+
+    def test_order_summary(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('order-summary'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], self.user.email)
+        self.assertEqual(response.data['order_count'], 2)
+        self.assertEqual(response.data['total_spent'], '300.00')
+
+        newcomer = Account.objects.create_user(email='new@example.com', name='New', password='password123')
+        self.client.force_authenticate(user=newcomer)
+        response = self.client.get(reverse('order-summary'))
+        self.assertEqual((response.data['order_count'], response.data['last_order_date']), (0, None))
+
+    def test_top_customers_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(reverse('top-customers')).status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = Account.objects.create_superuser(email='admin@example.com', name='Admin', password='password123')
+        anonymous = Account.objects.create_user(email='anonymous@example.com', name='Anonymous', password='x')
+        AccountOrderSummary.objects.create(account=anonymous, order_count=50, total_spent=5000)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('top-customers'), {'limit': 1})
+        self.assertEqual([customer['email'] for customer in response.data], [self.user.email])
+
+    def test_order_list_invalid_cursor(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ItemBulkUpsertIntegrationTests(APITestCase):
+
+    def setUp(self):
+        self.staff_user = Account.objects.create_pharmacist(
+            email='staffuser@example.com', password='password', name='staffuser'
+        )
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(
+            category=self.category,
+            name='Painkiller',
+            price=10.0,
+            quantity=100,
+        )
+        self.url = reverse('item-bulk')
+
+    def test_non_staff_user_cannot_bulk_upsert(self):
+        user = Account.objects.create_user(email='user@example.com', password='password', name='user')
+        self.client.force_authenticate(user=user)
+        response = self.client.post(self.url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_bulk_create_and_update(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.url, [
+            {'id': self.item.id, 'price': 12.5, 'quantity': 80},
+            {'category': self.category.id, 'name': 'Bandage', 'price': 3.0, 'quantity': 20},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], [self.item.id])
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual(response.data['errors'], [])
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.price, 12.5)
+        self.assertEqual(self.item.quantity, 80)
+        self.assertEqual(self.item.name, 'Painkiller')
+        self.assertTrue(Item.objects.filter(name='Bandage', quantity=20).exists())
+
+    def test_bulk_upsert_reports_row_errors(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.url, [
+            {'category': self.category.id, 'name': 'Valid', 'price': 1.0},
+            {'category': 999, 'name': 'Unknown category', 'price': 1.0},
+            {'id': 999, 'price': 1.0},
+            {'id': self.item.id, 'quantity': -1},
+            {'name': 'No category'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3, 4])
+        self.assertIn('category', response.data['errors'][0]['errors'])
+        self.assertIn('quantity', response.data['errors'][2]['errors'])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 100)
+
+    def test_bulk_upsert_rejects_non_list(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(self.url, {'name': 'Not a list'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportIntegrationTests(APITestCase):
+
+    def setUp(self):
+        self.staff_user = Account.objects.create_pharmacist(
+            email='staffuser@example.com', password='password', name='staffuser'
+        )
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=100)
+        Order.objects.create(item=self.item, user=self.staff_user, total_price=20.00, quantity=2)
+
+    def test_non_staff_user_cannot_export(self):
+        user = Account.objects.create_user(email='user@example.com', password='password', name='user')
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('order-export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_items_csv(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('item-export'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'category_id', 'category__name', 'name'])
+        self.assertEqual(lines[1].split(',')[:4], [str(self.item.id), str(self.category.id), 'Health', 'Painkiller'])
+
+        set_shard_count(self.item, 3)
+        response = self.client.get(reverse('item-export'), {'output': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[0]['stock'], 100)
+
+    def test_export_orders_ndjson(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('order-export'), {'output': 'ndjson'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['item__name'], 'Painkiller')
+        self.assertEqual(rows[0]['total_price'], '20.00')
+        self.assertEqual(rows[0]['quantity'], 2)
+
+    def test_export_orders_includes_archived(self):
+        recent = Order.objects.create(item=self.item, user=self.staff_user, total_price=10.00, quantity=1)
+        Order.objects.exclude(pk=recent.pk).update(order_date=timezone.now() - timedelta(days=500))
+        call_command('archive_orders', stdout=StringIO())
+        self.client.force_authenticate(user=self.staff_user)
+
+        response = self.client.get(reverse('order-export'), {'output': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['quantity'] for row in rows], [2, 1])
+
+    def test_export_unknown_output(self):
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get(reverse('order-export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CheckoutIntegrationTests(APITestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+        self.painkiller = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=10)
+        self.bandage = Item.objects.create(category=self.category, name='Bandage', price=2.5, quantity=4)
+        self.antibiotic = Item.objects.create(category=self.category, name='Antibiotic', price=25.0, quantity=10,
+                                              is_with_prescription=True)
+        self.user = Account.objects.create_user(email='user@example.com', name='Test User', password='password123')
+        Account.objects.create_user(email='anonymous@example.com', name='Anonymous User', password='password123')
+        self.url = reverse('checkout')
+
+    def test_checkout_success(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.url, {'items': [
+            {'item_id': self.painkiller.id, 'quantity': 2},
+            {'item_id': self.bandage.id, 'quantity': 4},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['message'], 'Bought 6 items for 30.0.')
+        self.assertEqual({line['item']: line['remaining_quantity'] for line in response.data['orders']},
+                         {self.painkiller.id: 8, self.bandage.id: 0})
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 2)
+
+    def test_checkout_is_all_or_nothing(self):
+        response = self.client.post(self.url, {'items': [
+            {'item_id': self.painkiller.id, 'quantity': 2},
+            {'item_id': self.bandage.id, 'quantity': 5},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], 'Not enough of Bandage. Currently available - 4!')
+        self.assertEqual(Item.objects.get(pk=self.painkiller.pk).quantity, 10)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_checkout_merges_repeated_items(self):
+        response = self.client.post(self.url, {'items': [
+            {'item_id': self.bandage.id, 'quantity': 3},
+            {'item_id': self.bandage.id, 'quantity': 2},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Item.objects.get(pk=self.bandage.pk).quantity, 4)
+
+    def test_checkout_rejects_prescription_and_unknown_items(self):
+        response = self.client.post(self.url, {'items': [{'item_id': self.antibiotic.id, 'quantity': 1}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], "Antibiotic is with prescription and can't be bought online!")
+
+        response = self.client.post(self.url, {'items': [{'item_id': 999, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], "Item 999 can't be found!")
+
+    def test_checkout_validates_lines(self):
+        response = self.client.post(self.url, {'items': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.url, {'items': [{'item_id': self.painkiller.id, 'quantity': 0}]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IdempotencyIntegrationTests(APITestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=10)
+        Account.objects.create_user(email='anonymous@example.com', name='Anonymous User', password='password123')
+        self.url = reverse('item-buy', kwargs={'pk': self.item.pk})
+
+    def test_retry_replays_first_response(self):
+        first = self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Item.objects.get(pk=self.item.pk).quantity, 8)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_different_request_is_refused(self):
+        self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc')
+        response = self.client.post(self.url, data={'quantity': 5}, HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Item.objects.get(pk=self.item.pk).quantity, 8)
+        self.assertEqual(Order.objects.count(), 1)
+
+        data = {'items': [{'item_id': self.item.id, 'quantity': 1}]}
+        self.client.post(reverse('checkout'), data, format='json', HTTP_IDEMPOTENCY_KEY='cart')
+        data['items'][0]['quantity'] = 2
+        response = self.client.post(reverse('checkout'), data, format='json', HTTP_IDEMPOTENCY_KEY='cart')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_different_keys_buy_twice(self):
+        self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='first')
+        self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='second')
+        self.client.post(self.url, data={'quantity': 2})
+        self.assertEqual(Item.objects.get(pk=self.item.pk).quantity, 4)
+
+    def test_key_in_progress_returns_conflict(self):
+        IdempotencyKey.objects.create(key='abc', scope=request_scope(APIRequestFactory().post(self.url)))
+        with patch('item.idempotency.IDEMPOTENCY_WAIT', 0):
+            response = self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_abandoned_claim_is_taken_over(self):
+        record = IdempotencyKey.objects.create(key='abc', scope=request_scope(APIRequestFactory().post(self.url)))
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+
+        response = self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, status.HTTP_200_OK)
+
+    def test_anonymous_callers_do_not_share_keys(self):
+        first = self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc', REMOTE_ADDR='10.0.0.1')
+        other = self.client.post(self.url, data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY='abc', REMOTE_ADDR='10.0.0.2')
+
+        self.assertFalse(other.has_header('Idempotent-Replayed'))
+        self.assertNotEqual(first.content, other.content)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_checkout_is_idempotent(self):
+        data = {'items': [{'item_id': self.item.id, 'quantity': 3}]}
+        self.client.post(reverse('checkout'), data, format='json', HTTP_IDEMPOTENCY_KEY='cart')
+        retry = self.client.post(reverse('checkout'), data, format='json', HTTP_IDEMPOTENCY_KEY='cart')
+        self.assertEqual(retry.json()['orders'][0]['remaining_quantity'], 7)
+        self.assertEqual(Item.objects.get(pk=self.item.pk).quantity, 7)
+
+
+class LoadTestIntegrationTests(TransactionTestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Health')
+        self.items = [
+            Item.objects.create(category=category, name=f'Item {i}', price=1.0, quantity=20) for i in range(3)
+        ]
+        Account.objects.create_user(email='anonymous@example.com', name='Anonymous User', password='password123')
+
+    def test_sequential_load_keeps_invariants(self):
+        report = run_load_test([item.pk for item in self.items], requests=40, workers=1, skew=1.5,
+                               quantities=(1, 4), seed=1)
+
+        self.assertEqual(report['requests'], 40)
+        self.assertEqual(report['errors'], 0)
+        self.assertGreater(report['successes'], 0)
+        self.assertGreater(report['rejected'], 0)
+        self.assertTrue(report['invariants_hold'])
+        self.assertEqual(report['new_orders'], report['successes'])
+        self.assertEqual(set(report['latency_ms']), {'p50', 'p90', 'p95', 'p99'})
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_command_buys_through_an_allowed_host(self):
+        output = StringIO()
+        call_command('loadtest_buy', requests=20, workers=1, seed=3, stdout=output)
+        self.assertIn('Stock and orders add up.', output.getvalue())
+
+        with patch('item.loadtest.BuyClient.buy', return_value=status.HTTP_400_BAD_REQUEST):
+            with self.assertRaises(CommandError):
+                call_command('loadtest_buy', requests=5, workers=1, stdout=StringIO())
+
+    def test_concurrent_load_never_oversells(self):
+        report = run_load_test([item.pk for item in self.items], requests=60, workers=4, quantities=(1, 3), seed=2)
+        self.assertGreater(report['successes'], 0)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['new_orders'], report['successes'])
+        self.assertTrue(report['invariants_hold'])
+        for item in self.items:
+            self.assertGreaterEqual(Item.objects.get(pk=item.pk).quantity, 0)
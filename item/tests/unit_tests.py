@@ -1,8 +1,22 @@
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
 from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework.exceptions import ValidationError
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 from unittest.mock import patch
 from decimal import Decimal
+from io import BytesIO, StringIO
+
+import numpy as np
+from PIL import Image
 
 from core.models import Account
 from item.views import *
@@ -10,6 +24,22 @@ from item.models import *
 from item.serializers import *
 from item.search import *
 from item.permissions import IsStuffOrReadOnly
+from item.archive import TieredOrders, archive_order_batches
+from item.bulk import bulk_upsert_items, validate_item_rows
+from item.exports import csv_stream, ndjson_stream
+from item.cohorts import record_activity, retention_matrix
+from item.columnar import (append_snapshot, compact_snapshot, load_columns, order_analytics, order_batches,
+                           read_manifest)
+from item.signals import catalog_changed
+from item.statistics_cache import cached_statistics
+from item.ledger import compact_ledger, record_movement, stock_as_of
+from item.orders import CheckoutError, checkout, link_account_batches
+from item.recommendations import compute_recommendations, related_items
+from item.stock import decrement_stock, available_stock, set_shard_count, rebalance_shards
+from item.sketches import (CountMinSketch, HyperLogLog, distinct_buyers, fold_sketch_events, purge_old_sketches,
+                           top_items)
+from item.timeseries import bucket_starts, moving_average
+from item.thumbnails import generate_thumbnails, rendition_path
 
 
 class SearchIntegrationTests(APITestCase):
@@ -215,7 +245,7 @@ class ItemSerializerTests(APITestCase):
         data = serializer.data
         self.assertEqual(set(data.keys()),
                          {'id', 'category', 'name', 'description', 'price', 'quantity', 'image', 'updated_at',
-                          'is_with_prescription'})
+                          'is_with_prescription', 'thumbnails'})
 
     def test_item_deserialization(self):
         data = {
@@ -466,6 +496,17 @@ class OrderModelTests(TestCase):
         self.assertEqual(str(self.order),
                          f'Order by {self.user} for {self.order.quantity} of {self.item} on {self.order.order_date}')
 
+    def test_order_keeps_item_snapshot(self):
+        self.assertEqual(self.order.item_name, 'Item1')
+        self.assertEqual(self.order.unit_price, Decimal('10.00'))
+
+        self.item.name = 'Renamed'
+        self.item.price = 12.5
+        self.item.save()
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.item_name, 'Item1')
+        self.assertEqual(order.unit_price, Decimal('10.00'))
+
 
 class OrderSerializerTests(TestCase):
 
@@ -492,7 +533,8 @@ class OrderSerializerTests(TestCase):
 
     def test_serializer_contains_expected_fields(self):
         data = self.serializer.data
-        self.assertEqual(set(data.keys()), set(['item', 'user', 'total_price', 'quantity', 'order_date']))
+        self.assertEqual(set(data.keys()), set(['item', 'item_name', 'unit_price', 'user', 'total_price', 'quantity',
+                                                'order_date']))
 
     def test_serializer_field_content(self):
         data = self.serializer.data
@@ -503,3 +545,731 @@ class OrderSerializerTests(TestCase):
         self.assertEqual(data['quantity'], 10)
         self.assertIn(expected_date[0], data['order_date'])
         self.assertIn(expected_date[1], data['order_date'])
+
+
+class ExportStreamTests(SimpleTestCase):
+
+    def test_first_row_is_sent_before_the_chunk_fills(self):
+        rows = [{'id': 1}, {'id': 2}, {'id': 3}]
+
+        self.assertEqual(list(csv_stream(iter(rows), ['id'], chunk_size=10)), ['id\r\n', '1\r\n', '2\r\n3\r\n'])
+        self.assertEqual(list(ndjson_stream(iter(rows), chunk_size=2)),
+                         ['{"id": 1}\n', '{"id": 2}\n{"id": 3}\n'])
+        self.assertEqual(list(ndjson_stream(iter([]))), [])
+
+
+class BulkUpsertTests(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+
+    def test_catalog_changed_sent_once_per_batch(self):
+        received = []
+
+        def receiver(sender, item_ids, **kwargs):
+            received.append(item_ids)
+
+        catalog_changed.connect(receiver)
+        try:
+            rows = [{'category': self.category.id, 'name': f'Item {i}', 'price': 1.0} for i in range(5)]
+            created, updated, errors = bulk_upsert_items(rows, chunk_size=2)
+        finally:
+            catalog_changed.disconnect(receiver)
+
+        self.assertEqual(len(created), 5)
+        self.assertEqual(Item.objects.count(), 5)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(sorted(received[0]), sorted(item.pk for item in created))
+
+    def test_catalog_change_expires_cached_statistics(self):
+        cache.clear()
+        computed = []
+
+        def compute():
+            computed.append(len(computed) + 1)
+            return computed[-1]
+
+        self.assertEqual(cached_statistics('all', compute)['data'], 1)
+        self.assertEqual(cached_statistics('all', compute)['data'], 1)
+        bulk_upsert_items([{'category': self.category.id, 'name': 'Renamed', 'price': 1.0}])
+        self.assertEqual(cached_statistics('all', compute)['data'], 2)
+
+    def test_price_rows_keep_stock_bought_during_the_upload(self):
+        painkiller = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=50)
+        plaster = Item.objects.create(category=self.category, name='Plaster', price=1.0, quantity=50)
+        validate = validate_item_rows
+
+        def validate_then_buy(rows):
+            validated = validate(rows)
+            checkout(Account.objects.create_user(email='buyer@example.com', name='Buyer', password='x'),
+                     [(painkiller.pk, 3)])
+            return validated
+
+        with patch('item.bulk.validate_item_rows', side_effect=validate_then_buy):
+            _, updated, errors = bulk_upsert_items([{'id': painkiller.pk, 'price': 12.0},
+                                                     {'id': plaster.pk, 'quantity': 40}])
+
+        self.assertEqual((errors, len(updated)), ([], 2))
+        painkiller.refresh_from_db()
+        self.assertEqual((painkiller.price, painkiller.quantity), (12.0, 47))
+        self.assertEqual(Item.objects.get(pk=plaster.pk).quantity, 40)
+        self.assertEqual(list(painkiller.stock_movements.values_list('delta', 'reason')),
+                         [(-3, StockMovement.PURCHASE)])
+
+
+class ImportCatalogCommandTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        Category.objects.create(name='Health')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_import_csv(self):
+        path = self.write('catalog.csv', 'category,name,description,price,quantity,is_with_prescription\n'
+                                         'Health,Aspirin,Pain reliever,2.20,100,false\n'
+                                         'Herbs,Mint,,1.10,5,false\n'
+                                         'Health,Broken,,not-a-price,1,false\n')
+        call_command('import_catalog', path, chunk_size=2, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(Item.objects.count(), 2)
+        self.assertEqual(Category.objects.filter(name='Health').count(), 1)
+        self.assertEqual(Item.objects.get(name='Mint').category.name, 'Herbs')
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_import_jsonl_resumes_from_checkpoint(self):
+        path = self.write('catalog.jsonl', '{"category": "Health", "name": "Aspirin", "price": 2.2}\n'
+                                           '{"category": "Health", "name": "Ibuprofen", "price": 3.1}\n')
+        self.write('catalog.jsonl.checkpoint', '1')
+        call_command('import_catalog', path, stdout=StringIO())
+
+        self.assertEqual(list(Item.objects.values_list('name', flat=True)), ['Ibuprofen'])
+
+    def test_rejected_rows_create_no_categories(self):
+        path = self.write('catalog.csv', 'category,name,price\n'
+                                         'Herbs,Mint,not-a-price\n'
+                                         'Tea,,1.50\n')
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Health'])
+        self.assertFalse(Item.objects.exists())
+
+    def test_malformed_jsonl_rows_are_reported(self):
+        path = self.write('catalog.jsonl', '{"category": "Health", "name": "Aspirin", "price": 2.2}\n'
+                                           '{"category": "Health", "name": \n'
+                                           '["not", "an", "object"]\n'
+                                           '{"category": "Health", "name": "Ibuprofen", "price": 3.1}\n')
+        stderr = StringIO()
+        call_command('import_catalog', path, chunk_size=2, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual(sorted(Item.objects.values_list('name', flat=True)), ['Aspirin', 'Ibuprofen'])
+        self.assertIn('Row 2: ', stderr.getvalue())
+        self.assertIn('Row 3: ', stderr.getvalue())
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.category = Category.objects.create(name='Health')
+
+    def upload(self, color='red'):
+        output = BytesIO()
+        Image.new('RGB', (2400, 1800), color).save(output, format='PNG')
+        return SimpleUploadedFile('photo.png', output.getvalue(), content_type='image/png')
+
+    def test_generate_thumbnails(self):
+        item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, image=self.upload())
+        image_hash = generate_thumbnails(item.pk)
+
+        item.refresh_from_db()
+        self.assertEqual(item.image_hash, image_hash)
+        for rendition, size in settings.THUMBNAIL_RENDITIONS.items():
+            with Image.open(os.path.join(self.media_root.name, rendition_path(image_hash, rendition))) as image:
+                self.assertLessEqual(image.size[0], size[0])
+                self.assertLessEqual(image.size[1], size[1])
+
+        thumbnails = ItemSerializer(item).data['thumbnails']
+        self.assertEqual(set(thumbnails), set(settings.THUMBNAIL_RENDITIONS))
+        self.assertTrue(thumbnails['list'].endswith(f'{image_hash}/list.jpg'))
+
+    def test_same_image_reuses_renditions(self):
+        first = Item.objects.create(category=self.category, name='First', price=1.0, image=self.upload())
+        second = Item.objects.create(category=self.category, name='Second', price=1.0, image=self.upload())
+        self.assertEqual(generate_thumbnails(first.pk), generate_thumbnails(second.pk))
+
+    def test_new_upload_resets_hash_and_schedules_generation(self):
+        item = Item.objects.create(category=self.category, name='Painkiller', price=10.0)
+        self.assertEqual(ItemSerializer(item).data['thumbnails'], {})
+
+        with patch('item.thumbnails.schedule_thumbnails') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                item.image_hash = 'stale'
+                item.image = self.upload('blue')
+                item.save()
+
+        self.assertEqual(item.image_hash, '')
+        schedule.assert_called_once_with(item.pk)
+
+    def test_removing_image_clears_thumbnails(self):
+        item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, image=self.upload())
+        generate_thumbnails(item.pk)
+        item.refresh_from_db()
+        self.assertTrue(ItemSerializer(item).data['thumbnails'])
+
+        item.image = None
+        item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.image_hash, '')
+        self.assertEqual(ItemSerializer(item).data['thumbnails'], {})
+
+
+class ExplainViewsCommandTests(TestCase):
+
+    def history_plan(self):
+        output = StringIO()
+        call_command('explain_views', stdout=output)
+        return output.getvalue().split('OrderHistoryView: orders of a user')[1].split('OrderHistoryView')[0]
+
+    @override_settings(ORDER_READS_BY_ACCOUNT=True)
+    def test_order_history_uses_composite_index(self):
+        history_plan = self.history_plan()
+        self.assertIn('order_account_date_id_idx', history_plan)
+        self.assertNotIn('TEMP B-TREE', history_plan)
+
+    def test_order_history_uses_email_index_before_backfill(self):
+        history_plan = self.history_plan()
+        self.assertIn('order_user_date_id_idx', history_plan)
+        self.assertNotIn('TEMP B-TREE', history_plan)
+
+    def test_fail_on_warnings(self):
+        with self.assertRaises(CommandError):
+            call_command('explain_views', fail_on_warnings=True, stdout=StringIO())
+
+
+class DecrementStockTests(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=5)
+
+    def test_decrement_returns_remaining(self):
+        self.assertEqual(decrement_stock(self.item, 3), 2)
+        self.assertEqual(decrement_stock(self.item, 2), 0)
+        self.assertIsNone(decrement_stock(self.item, 1))
+        self.assertEqual(available_stock(self.item), 0)
+
+    def test_decrement_without_update_returning(self):
+        with patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(decrement_stock(self.item, 4), 1)
+            self.assertIsNone(decrement_stock(self.item, 2))
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 1)
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        self.health = Category.objects.create(name='Health')
+        self.herbs = Category.objects.create(name='Herbs')
+        self.painkiller = Item.objects.create(category=self.health, name='Painkiller', price=10.0, quantity=100)
+        self.bandage = Item.objects.create(category=self.health, name='Bandage', price=2.0, quantity=100)
+        self.plaster = Item.objects.create(category=self.health, name='Plaster', price=1.0, quantity=100)
+        self.mint = Item.objects.create(category=self.herbs, name='Mint', price=1.0, quantity=100)
+        self.first = Account.objects.create_user(email='first@example.com', name='First', password='password123')
+        self.second = Account.objects.create_user(email='second@example.com', name='Second', password='password123')
+
+        for user in (self.first, self.second):
+            Order.objects.create(item=self.painkiller, user=user, total_price=10, quantity=1)
+            Order.objects.create(item=self.mint, user=user, total_price=1, quantity=1)
+        Order.objects.create(item=self.plaster, user=self.first, total_price=5, quantity=5)
+
+    def test_co_purchases_rank_first(self):
+        compute_recommendations(limit=3)
+        recommended = [row['id'] for row in related_items(self.painkiller)]
+        self.assertEqual(recommended, [self.mint.id, self.plaster.id, self.bandage.id])
+
+        kinds = list(ItemRecommendation.objects.filter(item=self.painkiller).values_list('kind', flat=True))
+        self.assertEqual(kinds, [ItemRecommendation.CO_PURCHASE, ItemRecommendation.CO_PURCHASE,
+                                 ItemRecommendation.CATEGORY])
+
+    def test_category_fallback_without_recommendations(self):
+        recommended = [row['id'] for row in related_items(self.bandage)]
+        self.assertEqual(sorted(recommended), sorted([self.painkiller.id, self.plaster.id]))
+
+    def test_command_replaces_recommendations(self):
+        call_command('compute_recommendations', limit=1, stdout=StringIO())
+        call_command('compute_recommendations', limit=1, stdout=StringIO())
+        self.assertEqual(ItemRecommendation.objects.filter(item=self.painkiller).count(), 1)
+        self.assertEqual(ItemRecommendation.objects.count(), 4)
+
+
+class StockShardTests(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=10)
+
+    def test_set_shard_count_splits_stock(self):
+        item = set_shard_count(self.item, 3)
+        self.assertEqual(item.quantity, 0)
+        self.assertEqual(list(item.stock_shards.values_list('quantity', flat=True)), [4, 3, 3])
+        self.assertEqual(Item.objects.with_stock().get(pk=item.pk).stock, 10)
+        self.assertEqual(ItemSerializer(item).data['quantity'], 10)
+
+        item = set_shard_count(item, 0)
+        self.assertEqual(item.quantity, 10)
+        self.assertFalse(StockShard.objects.exists())
+
+    def test_decrement_sharded_stock(self):
+        item = set_shard_count(self.item, 3)
+        with transaction.atomic():
+            self.assertEqual(decrement_stock(item, 2), 8)
+            # No single shard holds 7 anymore, so this one takes from several shards
+            self.assertEqual(decrement_stock(item, 7), 1)
+            self.assertIsNone(decrement_stock(item, 2))
+        self.assertEqual(available_stock(item), 1)
+
+    def test_rebalance_shards(self):
+        item = set_shard_count(self.item, 2)
+        StockShard.objects.filter(item=item, number=0).update(quantity=0)
+        self.assertEqual(rebalance_shards(item), 5)
+        self.assertEqual(list(item.stock_shards.values_list('quantity', flat=True)), [3, 2])
+
+    def test_serializer_update_sets_sharded_stock(self):
+        item = set_shard_count(self.item, 2)
+        serializer = ItemSerializer(item, data={'quantity': 7}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(list(item.stock_shards.values_list('quantity', flat=True)), [4, 3])
+        self.assertEqual(Item.objects.get(pk=item.pk).quantity, 0)
+
+    def test_shard_stock_command(self):
+        call_command('shard_stock', self.item.pk, shards=4, stdout=StringIO())
+        self.assertEqual(StockShard.objects.filter(item=self.item).count(), 4)
+        call_command('shard_stock', rebalance=True, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('shard_stock', shards=2, stdout=StringIO())
+
+
+class StockLedgerTests(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+        self.item = ItemSerializer().create({'category': self.category, 'name': 'Painkiller', 'price': 10.0,
+                                             'quantity': 10})
+
+    def test_changes_are_recorded(self):
+        with transaction.atomic():
+            decrement_stock(self.item, 3)
+        serializer = ItemSerializer(self.item, data={'quantity': 20}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        bulk_upsert_items([{'id': self.item.id, 'quantity': 15}])
+
+        self.assertEqual(list(self.item.stock_movements.order_by('pk').values_list('delta', 'reason')), [
+            (10, StockMovement.STAFF_EDIT),
+            (-3, StockMovement.PURCHASE),
+            (13, StockMovement.STAFF_EDIT),
+            (-5, StockMovement.BULK_UPDATE),
+        ])
+        self.assertEqual(stock_as_of(self.item.pk), 15)
+
+    def test_repeated_rows_in_one_chunk(self):
+        self.item.quantity = 100
+        self.item.save()
+        record_movement(self.item.pk, 90, StockMovement.STAFF_EDIT)
+        bulk_upsert_items([{'id': self.item.id, 'quantity': 80}, {'id': self.item.id, 'quantity': 70}])
+
+        self.assertEqual(Item.objects.get(pk=self.item.pk).quantity, 70)
+        self.assertEqual(stock_as_of(self.item.pk), 70)
+
+    def test_stock_as_of_across_compaction(self):
+        start = timezone.now()
+        record_movement(self.item.pk, -4, StockMovement.PURCHASE)
+        StockMovement.objects.update(created_at=start - timedelta(hours=3))
+        record_movement(self.item.pk, 5, StockMovement.STAFF_EDIT)
+        StockMovement.objects.filter(delta=5).update(created_at=start - timedelta(hours=2))
+        record_movement(self.item.pk, -1, StockMovement.PURCHASE)
+
+        self.assertEqual(compact_ledger(timedelta(hours=1)), 1)
+        snapshot = StockSnapshot.objects.get(item=self.item)
+        self.assertEqual(snapshot.quantity, 11)
+
+        self.assertEqual(stock_as_of(self.item.pk), 10)
+        self.assertEqual(stock_as_of(self.item.pk, start - timedelta(minutes=150)), 6)
+        self.assertEqual(stock_as_of(self.item.pk, start - timedelta(minutes=90)), 11)
+
+        record_movement(self.item.pk, 2, StockMovement.STAFF_EDIT)
+        self.assertEqual(compact_ledger(timedelta(0), prune=True), 1)
+        self.assertEqual(StockMovement.objects.count(), 0)
+        self.assertEqual(stock_as_of(self.item.pk), 12)
+
+
+class OrderArchiveTests(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=10)
+        self.user = Account.objects.create_user(email='user@example.com', name='User', password='password123')
+        self.orders = [
+            Order.objects.create(item=self.item, user=self.user, total_price=10 * quantity, quantity=quantity)
+            for quantity in range(1, 6)
+        ]
+        now = timezone.now()
+        for days, order in zip([400, 300, 200, 2, 1], self.orders):
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(days=days))
+
+    def test_archive_moves_old_orders_in_batches(self):
+        batches = list(archive_order_batches(timezone.now() - timedelta(days=100), batch_size=2))
+
+        self.assertEqual(batches, [2, 1])
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.orders[3].pk, self.orders[4].pk})
+        archived = ArchivedOrder.objects.get(pk=self.orders[0].pk)
+        self.assertEqual((archived.quantity, archived.total_price, archived.item_name), (1, Decimal('10.00'),
+                                                                                        'Painkiller'))
+
+    def test_archived_orders_keep_counting(self):
+        list(archive_order_batches(timezone.now() - timedelta(days=100)))
+
+        self.assertEqual(AccountOrderSummary.objects.get(account=self.user).order_count, 5)
+        self.assertEqual(sum(DailySales.objects.values_list('orders', flat=True)), 5)
+
+    def test_archive_orders_command(self):
+        output = StringIO()
+        call_command('archive_orders', days=250, stdout=output)
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+        self.assertIn('Archived 2 orders', output.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('archive_orders', days=-1, stdout=StringIO())
+
+    def test_tiered_orders_read_hot_then_archived(self):
+        list(archive_order_batches(timezone.now() - timedelta(days=100)))
+        orders = TieredOrders(Order.objects.all(), ArchivedOrder.objects.all()).order_by('-order_date', '-id')
+        expected = [order.pk for order in reversed(self.orders)]
+
+        self.assertEqual(orders.count(), 5)
+        self.assertEqual([order.pk for order in orders], expected)
+        self.assertEqual([order.pk for order in orders[0:3]], expected[:3])
+        self.assertEqual([order.pk for order in orders[3:5]], expected[3:])
+        self.assertEqual([order.pk for order in orders.filter(quantity__gt=1)[1:3]], expected[1:3])
+
+    def test_backfill_links_orders_to_accounts(self):
+        self.assertEqual(self.orders[0].account_id, self.user.pk)
+        list(archive_order_batches(timezone.now() - timedelta(days=100)))
+        Order.objects.update(account=None)
+        ArchivedOrder.objects.update(account=None)
+
+        self.assertEqual(list(link_account_batches(Order, batch_size=1)), [1, 1])
+        output = StringIO()
+        call_command('backfill_order_accounts', batch_size=2, stdout=output)
+
+        self.assertEqual(set(ArchivedOrder.objects.values_list('account_id', flat=True)), {self.user.pk})
+        self.assertEqual(set(Order.objects.values_list('account_id', flat=True)), {self.user.pk})
+        self.assertIn('Linked 3 archived orders', output.getvalue())
+        self.assertIn('Every order has an account', output.getvalue())
+
+
+class SalesRollupTests(TestCase):
+
+    def setUp(self):
+        self.health = Category.objects.create(name='Health')
+        self.beauty = Category.objects.create(name='Beauty')
+        self.painkiller = Item.objects.create(category=self.health, name='Painkiller', price=10.0, quantity=10)
+        self.cream = Item.objects.create(category=self.beauty, name='Cream', price=2.5, quantity=10)
+        self.user = Account.objects.create_user(email='user@example.com', name='User', password='password123')
+
+    def rollups(self):
+        return {
+            'day': list(DailySales.objects.values_list('revenue', 'units', 'orders')),
+            'category': dict(DailyCategorySales.objects.values_list('category_id', 'revenue')),
+            'item': dict(DailyItemSales.objects.values_list('item_id', 'units')),
+        }
+
+    def test_orders_update_rollups(self):
+        Order.objects.create(item=self.painkiller, user=self.user, total_price=Decimal('20.00'), quantity=2)
+        checkout(self.user, [(self.painkiller.pk, 1), (self.cream.pk, 4)])
+
+        self.assertEqual(self.rollups(), {
+            'day': [(Decimal('40.00'), 7, 3)],
+            'category': {self.health.pk: Decimal('30.00'), self.beauty.pk: Decimal('10.00')},
+            'item': {self.painkiller.pk: 3, self.cream.pk: 4},
+        })
+
+    def test_failed_checkout_leaves_rollups_alone(self):
+        with self.assertRaises(CheckoutError):
+            checkout(self.user, [(self.painkiller.pk, 1), (self.cream.pk, 40)])
+        self.assertFalse(DailySales.objects.exists())
+
+    def test_deleted_orders_are_subtracted(self):
+        order = Order.objects.create(item=self.cream, user=self.user, total_price=Decimal('5.00'), quantity=2)
+        order.delete()
+        self.assertEqual(self.rollups()['day'], [(Decimal('0.00'), 0, 0)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        checkout(self.user, [(self.painkiller.pk, 2), (self.cream.pk, 1)])
+        Order.objects.create(item=self.cream, user=self.user, total_price=Decimal('5.00'), quantity=2)
+        incremental = self.rollups()
+        DailyItemSales.objects.update(units=0)
+
+        output = StringIO()
+        call_command('rebuild_rollups', stdout=output)
+        self.assertEqual(self.rollups(), incremental)
+        self.assertIn('1 days', output.getvalue())
+
+
+class TimeSeriesTests(TestCase):
+
+    def test_bucket_starts(self):
+        days = np.arange(np.datetime64('2024-01-29'), np.datetime64('2024-02-06'))
+        self.assertEqual([str(day) for day in bucket_starts(days, 'week')],
+                         ['2024-01-29'] * 7 + ['2024-02-05'])
+        self.assertEqual([str(day) for day in bucket_starts(days, 'month')],
+                         ['2024-01-01'] * 3 + ['2024-02-01'] * 5)
+        self.assertTrue((bucket_starts(days, 'day') == days).all())
+
+    def test_moving_average(self):
+        self.assertEqual(moving_average(np.array([3.0, 6.0, 9.0, 0.0]), 3).tolist(), [3.0, 4.5, 6.0, 5.0])
+        self.assertEqual(moving_average(np.array([2.0, 4.0]), 5).tolist(), [2.0, 3.0])
+
+
+class SketchTests(TestCase):
+
+    def test_hyperloglog_estimates_and_merges(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for number in range(3000):
+            first.add(f'user{number}@example.com')
+        for number in range(2000, 5000):
+            second.add(f'user{number}@example.com')
+            second.add(f'user{number}@example.com')
+
+        self.assertAlmostEqual(first.count(), 3000, delta=150)
+        restored = HyperLogLog.from_bytes(first.to_bytes())
+        self.assertEqual(restored.count(), first.count())
+        self.assertAlmostEqual(restored.merge(second).count(), 5000, delta=250)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_count_min_sketch_tracks_heavy_hitters(self):
+        first, second = CountMinSketch(top_k=3), CountMinSketch(top_k=3)
+        for item_id in range(1, 200):
+            first.add(item_id)
+        first.add(7, 50)
+        second.add(9, 40)
+        second.add(7, 5)
+
+        self.assertGreaterEqual(first.estimate(7), 51)
+        merged = CountMinSketch.from_bytes(first.to_bytes()).merge(second)
+        self.assertEqual([item_id for item_id, _ in merged.top(2)], [7, 9])
+        self.assertGreaterEqual(merged.estimate(7), 56)
+        self.assertLessEqual(len(merged.heavy), 3)
+
+    def test_purchases_feed_the_sketches(self):
+        category = Category.objects.create(name='Health')
+        painkiller = Item.objects.create(category=category, name='Painkiller', price=10.0, quantity=50)
+        plaster = Item.objects.create(category=category, name='Plaster', price=1.0, quantity=50)
+        users = [Account.objects.create_user(email=f'user{number}@example.com', name='User', password='password123')
+                 for number in range(3)]
+        anonymous = Account.objects.create_user(email='anonymous@example.com', name='Anonymous', password='x')
+        for user in users + [anonymous]:
+            Order.objects.create(item=painkiller, user=user, total_price=20, quantity=2)
+        checkout(users[0], [(plaster.pk, 3)])
+
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        self.assertEqual(SketchEvent.objects.count(), 5)
+        self.assertFalse(AnalyticsSketch.objects.exists())
+        self.assertEqual(distinct_buyers(an_hour_ago), 3)
+        self.assertEqual(top_items(an_hour_ago, 2), [(painkiller.pk, 8), (plaster.pk, 3)])
+
+        self.assertEqual(next(fold_sketch_events(batch_size=3)), 3)
+        self.assertEqual(distinct_buyers(an_hour_ago), 3)
+        self.assertEqual(top_items(an_hour_ago, 2), [(painkiller.pk, 8), (plaster.pk, 3)])
+        self.assertEqual(list(fold_sketch_events(batch_size=3)), [2])
+
+        self.assertEqual(distinct_buyers(an_hour_ago), 3)
+        self.assertEqual(top_items(an_hour_ago, 2), [(painkiller.pk, 8), (plaster.pk, 3)])
+        self.assertEqual(AnalyticsSketch.objects.count(), 2)
+        self.assertFalse(SketchEvent.objects.exists())
+
+    @override_settings(SKETCH_ITEM_RETENTION_DAYS=2, SKETCH_BUYER_RETENTION_DAYS=62)
+    def test_old_sketches_are_purged(self):
+        now = timezone.now()
+        for days in (1, 3, 70):
+            SketchEvent.objects.create(order_date=now - timedelta(days=days), buyer='user@example.com',
+                                       item_id=1, quantity=1)
+        list(fold_sketch_events())
+        self.assertEqual(AnalyticsSketch.objects.count(), 6)
+
+        self.assertEqual(purge_old_sketches(now), 3)
+        self.assertEqual(AnalyticsSketch.objects.filter(kind=AnalyticsSketch.ITEMS).count(), 1)
+        self.assertEqual(AnalyticsSketch.objects.filter(kind=AnalyticsSketch.BUYERS).count(), 2)
+
+
+class OrderSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(ORDER_SNAPSHOT_DIR=self.directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=self.category, name='Painkiller', price=10.0, quantity=100)
+        self.users = [Account.objects.create_user(email=f'user{number}@example.com', name='User',
+                                                  password='password123') for number in range(2)]
+
+    def order(self, user, quantity, days_ago=0):
+        order = Order.objects.create(item=self.item, user=user, total_price=10 * quantity, quantity=quantity)
+        Order.objects.filter(pk=order.pk).update(order_date=order.order_date - timedelta(days=days_ago))
+        return order
+
+    def test_snapshot_appends_new_orders(self):
+        self.order(self.users[0], 1, days_ago=40)
+        self.order(self.users[1], 2)
+        self.assertEqual(append_snapshot(), 2)
+        self.assertEqual(append_snapshot(), 0)
+
+        last = self.order(self.users[0], 3)
+        output = StringIO()
+        call_command('snapshot_orders', stdout=output)
+        self.assertIn('Added 1 orders', output.getvalue())
+
+        manifest = read_manifest()
+        self.assertEqual((manifest['rows'], len(manifest['segments']), manifest['last_order_id']), (3, 2, last.pk))
+        columns = load_columns()
+        self.assertEqual(sorted(columns['quantity'].tolist()), [1, 2, 3])
+        self.assertEqual(set(columns['customer'].tolist()), {user.id for user in self.users})
+
+        Order.objects.filter(pk=last.pk).update(order_date=timezone.now() - timedelta(days=500))
+        call_command('archive_orders', stdout=StringIO())
+        self.assertTrue(ArchivedOrder.objects.filter(pk=last.pk).exists())
+        batches = list(order_batches(0, last.pk, batch_size=2))
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(sorted(row[5] for batch in batches for row in batch), [1, 2, 3])
+
+        compact_snapshot()
+        self.assertEqual(len(read_manifest()['segments']), 1)
+        self.assertIsInstance(load_columns()['id'], np.memmap)
+        self.assertEqual(sorted(load_columns()['total_price'].tolist()), [10.0, 20.0, 30.0])
+
+    def test_order_analytics(self):
+        self.order(self.users[0], 1, days_ago=40)
+        self.order(self.users[0], 3)
+        self.order(self.users[1], 2)
+        anonymous = Account.objects.create_user(email='anonymous@example.com', name='Anonymous', password='x')
+        self.order(anonymous, 5)
+        self.assertEqual(append_snapshot(), 3)
+
+        analytics = order_analytics(load_columns(), bins=2)
+
+        self.assertEqual((analytics['orders'], analytics['customers']), (3, 2))
+        self.assertEqual(analytics['unit_price']['histogram']['counts'], [0, 3])
+        self.assertEqual(analytics['units_per_order']['p50'], 2.0)
+        self.assertEqual(analytics['spend_per_customer']['mean'], 30.0)
+        cohorts = [(cohort['customers'], cohort['orders'], cohort['revenue']) for cohort in analytics['cohorts']]
+        self.assertEqual(cohorts, [(1, 2, 40.0), (1, 1, 20.0)])
+
+
+class CohortTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=category, name='Painkiller', price=10.0, quantity=100)
+        self.first = Account.objects.create_user(email='first@example.com', name='First', password='password123')
+        self.second = Account.objects.create_user(email='second@example.com', name='Second', password='password123')
+
+    def at(self, year, month, day=15):
+        return timezone.make_aware(datetime(year, month, day, 12))
+
+    def purchase(self, user, when):
+        record_activity([Order(item=self.item, user=user, total_price=10, quantity=1, order_date=when)])
+
+    def test_activity_fills_retention_cells(self):
+        self.purchase(self.first, self.at(2024, 1))
+        self.purchase(self.first, self.at(2024, 1, 20))
+        self.purchase(self.first, self.at(2024, 3))
+        self.purchase(self.second, self.at(2024, 1))
+        self.purchase(self.second, self.at(2024, 2))
+
+        self.assertEqual(retention_matrix(months=2), [{
+            'month': '2024-01', 'customers': 2, 'counts': [2, 1, 1], 'retention': [1.0, 0.5, 0.5],
+        }])
+        activity = CustomerActivity.objects.get(account=self.first)
+        self.assertEqual((activity.first_month, bytes(activity.months)), (date(2024, 1, 1), bytes([0b101])))
+
+    def test_earlier_order_moves_customer_to_older_cohort(self):
+        self.purchase(self.first, self.at(2024, 3))
+        self.purchase(self.first, self.at(2024, 1))
+
+        self.assertEqual(dict(CohortCell.objects.values_list('cohort', 'customers').filter(offset=0)),
+                         {date(2024, 1, 1): 1, date(2024, 3, 1): 0})
+        self.assertEqual(retention_matrix(since=date(2024, 1, 1), months=2)[0]['counts'], [1, 0, 1])
+
+    def test_orders_update_cohorts_and_rebuild_matches(self):
+        orders = [Order.objects.create(item=self.item, user=user, total_price=10, quantity=1)
+                  for user in (self.first, self.second, self.first)]
+        self.assertEqual(CustomerActivity.objects.count(), 2)
+
+        Order.objects.filter(pk=orders[0].pk).update(order_date=self.at(2023, 11))
+        call_command('rebuild_cohorts', stdout=StringIO())
+        cohorts = {cohort['month']: cohort['counts'][:1] for cohort in retention_matrix()}
+        self.assertEqual(cohorts, {'2023-11': [1], timezone.localdate().strftime('%Y-%m'): [1]})
+
+
+class AccountOrderSummaryTests(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='Health')
+        self.item = Item.objects.create(category=category, name='Painkiller', price=10.0, quantity=100)
+        self.user = Account.objects.create_user(email='user@example.com', name='User', password='password123')
+
+    def test_orders_update_summary(self):
+        first = Order.objects.create(item=self.item, user=self.user, total_price=Decimal('20.00'), quantity=2)
+        orders, _ = checkout(self.user, [(self.item.pk, 3)])
+
+        summary = AccountOrderSummary.objects.get(account=self.user)
+        self.assertEqual((summary.order_count, summary.total_spent), (2, Decimal('50.00')))
+        self.assertEqual(summary.last_order_date, orders[0].order_date)
+
+        first.delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.order_count, summary.total_spent), (1, Decimal('30.00')))
+
+    def test_repair_recomputes_from_both_tiers(self):
+        old = Order.objects.create(item=self.item, user=self.user, total_price=Decimal('20.00'), quantity=2)
+        recent = Order.objects.create(item=self.item, user=self.user, total_price=Decimal('10.00'), quantity=1)
+        Order.objects.filter(pk=old.pk).update(order_date=timezone.now() - timedelta(days=500))
+        call_command('archive_orders', stdout=StringIO())
+        AccountOrderSummary.objects.update(order_count=0, total_spent=0, last_order_date=None)
+        other = Account.objects.create_user(email='other@example.com', name='Other', password='password123')
+        AccountOrderSummary.objects.create(account=other, order_count=5, total_spent=5)
+
+        output = StringIO()
+        call_command('repair_order_summaries', batch_size=1, stdout=output)
+
+        summary = AccountOrderSummary.objects.get(account=self.user)
+        self.assertEqual((summary.order_count, summary.total_spent), (2, Decimal('30.00')))
+        self.assertEqual(summary.last_order_date, Order.objects.get(pk=recent.pk).order_date)
+        self.assertFalse(AccountOrderSummary.objects.filter(account=other).exists())
+        self.assertIn('2 accounts', output.getvalue())
+
+    def test_anonymous_account_has_no_summary(self):
+        anonymous = Account.objects.create_user(email='anonymous@example.com', name='Anonymous', password='x')
+        checkout(anonymous, [(self.item.pk, 1)])
+        self.assertFalse(AccountOrderSummary.objects.exists())
+
+        AccountOrderSummary.objects.create(account=anonymous, order_count=1, total_spent=10)
+        call_command('repair_order_summaries', stdout=StringIO())
+        self.assertFalse(AccountOrderSummary.objects.exists())
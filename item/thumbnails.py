@@ -0,0 +1,87 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+
+from .models import Item
+
+THUMBNAIL_DIR = 'thumbnails'
+
+executor = ThreadPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 1),
+                              thread_name_prefix='thumbnails')
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.open('rb')
+    try:
+        for chunk in file.chunks():
+            digest.update(chunk)
+    finally:
+        file.close()
+    return digest.hexdigest()
+
+
+def rendition_path(image_hash, rendition):
+    return f'{THUMBNAIL_DIR}/{image_hash[:2]}/{image_hash}/{rendition}.jpg'
+
+
+def render(file, size):
+    file.open('rb')
+    try:
+        with Image.open(file) as image:
+            image = image.convert('RGB')
+            image.thumbnail(size)
+            output = BytesIO()
+            image.save(output, format='JPEG', quality=85, optimize=True)
+    finally:
+        file.close()
+    return ContentFile(output.getvalue())
+
+
+def generate_thumbnails(item_id):
+    """
+    Renders every rendition of the item's image. Renditions are keyed by the content hash, so re-uploading
+    the same photo, or the same photo on several items, reuses the files already on disk.
+    """
+    item = Item.objects.filter(pk=item_id).only('image').first()
+    if not item or not item.image:
+        return None
+
+    image_hash = content_hash(item.image)
+    for rendition, size in settings.THUMBNAIL_RENDITIONS.items():
+        path = rendition_path(image_hash, rendition)
+        if not default_storage.exists(path):
+            default_storage.save(path, render(item.image, size))
+
+    # Skip the update if the image was replaced or removed while the renditions were being rendered
+    Item.objects.filter(pk=item_id, image=item.image.name).update(image_hash=image_hash)
+    return image_hash
+
+
+def _generate_in_background(item_id):
+    try:
+        generate_thumbnails(item_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(item_id):
+    if getattr(settings, 'THUMBNAILS_ASYNC', True):
+        executor.submit(_generate_in_background, item_id)
+    else:
+        generate_thumbnails(item_id)
+
+
+def thumbnail_urls(item):
+    if not item.image_hash:
+        return {}
+    return {
+        rendition: default_storage.url(rendition_path(item.image_hash, rendition))
+        for rendition in settings.THUMBNAIL_RENDITIONS
+    }
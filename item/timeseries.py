@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+import numpy as np
+
+from .models import DailyCategorySales, DailySales
+
+BUCKETS = ('day', 'week', 'month')
+MOVING_AVERAGE_WINDOW = 7
+MAX_SERIES_DAYS = 3660
+# 1970-01-05, day 4 of the epoch, was a Monday
+EPOCH_MONDAY = 4
+
+
+def bucket_starts(days, bucket):
+    """
+    Maps every day of a datetime64[D] array to the first day of its bucket. Weeks start on Monday.
+    """
+    if bucket == 'week':
+        return days - (days.astype('int64') - EPOCH_MONDAY) % 7
+    if bucket == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    return days
+
+
+def daily_column(rows, start, length):
+    """
+    Spreads sparse (day, value) rows over a dense array with one slot per day starting at `start`.
+    """
+    column = np.zeros(length)
+    if rows:
+        days, values = zip(*rows)
+        np.add.at(column, (np.array(days, dtype='datetime64[D]') - start).astype('int64'),
+                  np.array(values, dtype=float))
+    return column
+
+
+def moving_average(values, window):
+    """
+    Trailing mean over the last `window` values. The first values average over what is available so far.
+    """
+    totals = np.cumsum(values)
+    totals[window:] = totals[window:] - totals[:-window]
+    return totals / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+def sales_series(start, end, bucket='day', window=MOVING_AVERAGE_WINDOW):
+    """
+    Revenue, order count and average order value per bucket between `start` and `end` inclusive, with a
+    moving average of the revenue and the revenue of every category. Reads the daily rollups once and does
+    the bucketing with NumPy.
+    """
+    first = np.datetime64(start, 'D')
+    days = np.arange(first, np.datetime64(end + timedelta(days=1), 'D'))
+    sales = list(DailySales.objects.filter(day__range=(start, end)).values_list('day', 'revenue', 'orders'))
+    revenue = daily_column([(day, value) for day, value, _ in sales], first, len(days))
+    orders = daily_column([(day, count) for day, _, count in sales], first, len(days))
+
+    starts = bucket_starts(days, bucket)
+    boundaries = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    bucket_revenue = np.add.reduceat(revenue, boundaries)
+    bucket_orders = np.add.reduceat(orders, boundaries)
+    average = np.divide(bucket_revenue, bucket_orders, out=np.zeros_like(bucket_revenue), where=bucket_orders > 0)
+
+    category_rows = DailyCategorySales.objects.filter(day__range=(start, end), orders__gt=0).values_list(
+        'category_id', 'day', 'revenue')
+    by_category = {}
+    for category_id, day, value in category_rows:
+        by_category.setdefault(category_id, []).append((day, value))
+    categories = {
+        category_id: np.add.reduceat(daily_column(rows, first, len(days)), boundaries).round(2).tolist()
+        for category_id, rows in by_category.items()
+    }
+
+    return {
+        'bucket': bucket,
+        'periods': [str(day) for day in starts[boundaries]],
+        'revenue': bucket_revenue.round(2).tolist(),
+        'orders': bucket_orders.astype('int64').tolist(),
+        'average_order_value': average.round(2).tolist(),
+        'revenue_moving_average': moving_average(bucket_revenue, window).round(2).tolist(),
+        'revenue_by_category': categories,
+    }
@@ -1,16 +1,35 @@
+from datetime import datetime, timedelta
+from itertools import chain
+
 from rest_framework import permissions, viewsets, status, generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum, Avg
-from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from .serializers import ItemSerializer, CategorySerializer, OrderSerializer, BusinessStatisticsSerializer
-from .models import Item, Category, Order
+from .serializers import ItemSerializer, CategorySerializer, OrderSerializer, BusinessStatisticsSerializer, \
+    CheckoutSerializer, RelatedItemSerializer, AccountOrderSummarySerializer
+from .models import Item, Category, Order, ArchivedOrder, DailySales, AccountOrderSummary
 from .filters import OrderFilter
-from .permissions import IsStuffOrReadOnly, IsAdmin
+from .pagination import OrderKeysetPagination
+from .permissions import IsStuffOrReadOnly, IsAdmin, IsStaff
 from .search import perform_nlp_search
+from .bulk import bulk_upsert_items
+from .stock import decrement_stock, available_stock
+from .orders import ANONYMOUS_EMAIL, CheckoutError, checkout, order_user, orders_of
+from .recommendations import related_items
+from .exports import EXPORT_CHUNK_SIZE, csv_stream, ndjson_stream
+from .archive import TieredOrders
+from .statistics import business_statistics, timed
+from .statistics_cache import cached_statistics
+from .cohorts import RETENTION_MONTHS, retention_matrix
+from .columnar import load_columns, order_analytics, read_manifest
+from .sketches import SKETCH_TOP_K, distinct_buyers, start_of_day, start_of_month, top_items
+from .timeseries import BUCKETS, MAX_SERIES_DAYS, MOVING_AVERAGE_WINDOW, sales_series
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
@@ -26,102 +45,282 @@ class ItemViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows items to be viewed or edited.
     """
-    queryset = Item.objects.all()
+    queryset = Item.objects.with_stock()
     serializer_class = ItemSerializer
     permission_classes = [IsStuffOrReadOnly]
 
 
+class ItemBulkUpsertView(APIView):
+    """
+    API endpoint that creates or updates many items at once. Rows with an `id` are updated, the rest are created.
+    """
+    permission_classes = [IsStaff]
+
+    def post(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a list of items.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        created, updated, errors = bulk_upsert_items(rows)
+        return Response({
+            'created': [item.pk for item in created],
+            'updated': [item.pk for item in updated],
+            'errors': errors,
+        }, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def item_buy(request, pk):
     res_status = status.HTTP_400_BAD_REQUEST
     message = 'Item can\'t be found!'
 
-    items = Item.objects.filter(pk=pk)
-    item = None
-    related_items = []
-    if items:
-        item = items[0]
-        related_items = Item.objects.filter(category=item.category).exclude(pk=pk)[0:3]
-        related_items = ItemSerializer(data=related_items, many=True)
-        related_items.is_valid()
-        related_items = related_items.data
+    item = Item.objects.filter(pk=pk).first()
+    related = []
+    if item:
+        related = RelatedItemSerializer(related_items(item), many=True).data
         message = 'Item is with prescription and can\'t be bought online!'
 
+    remaining_quantity = None
     if item and not item.is_with_prescription:
-        old_quantity = item.quantity
         data = request.data
         buy_quantity = int(data['quantity'])
         if not buy_quantity > 0:
             message = f'Can\'t buy 0 products.'
             res_status = status.HTTP_400_BAD_REQUEST
-        elif old_quantity - buy_quantity < 0:
-            message = f'Not enough of the product. Currently available - {old_quantity}!'
-            res_status = status.HTTP_400_BAD_REQUEST
         else:
-            item.quantity = old_quantity - buy_quantity
-            item.save()
-            total_price = buy_quantity * item.price
-            message = f'Bought {buy_quantity} items for {total_price}.'
-            res_status = status.HTTP_200_OK
-            user = request.user if request.user.is_authenticated else get_user_model().objects.get(
-                email='anonymous@example.com')
-            Order(item=item, user=user, quantity=buy_quantity, total_price=total_price).save()
-
-    return Response({
-        'related_items': related_items,
+            user = order_user(request)
+            with transaction.atomic():
+                remaining_quantity = decrement_stock(item, buy_quantity)
+                if remaining_quantity is not None:
+                    total_price = buy_quantity * item.price
+                    Order(item=item, user=user, quantity=buy_quantity, total_price=total_price).save()
+
+            if remaining_quantity is None:
+                message = f'Not enough of the product. Currently available - {available_stock(item)}!'
+                res_status = status.HTTP_400_BAD_REQUEST
+            else:
+                message = f'Bought {buy_quantity} items for {total_price}.'
+                res_status = status.HTTP_200_OK
+
+    response = {
+        'related_items': related,
         'message': message
-    }, status=res_status)
+    }
+    if remaining_quantity is not None:
+        response['remaining_quantity'] = remaining_quantity
+    return Response(response, status=res_status)
+
+
+class CheckoutView(APIView):
+    """
+    API endpoint that buys several items in one all-or-nothing transaction.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, *args, **kwargs):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = [(line['item_id'], line['quantity']) for line in serializer.validated_data['items']]
+
+        try:
+            orders, remaining = checkout(order_user(request), lines)
+        except CheckoutError as exc:
+            return Response({'message': exc.message}, status=status.HTTP_400_BAD_REQUEST)
+
+        total_price = sum(order.total_price for order in orders)
+        return Response({
+            'orders': [{
+                'item': order.item_id,
+                'quantity': order.quantity,
+                'total_price': order.total_price,
+                'remaining_quantity': remaining[order.item_id],
+            } for order in orders],
+            'total_price': total_price,
+            'message': f'Bought {sum(order.quantity for order in orders)} items for {total_price}.',
+        }, status=status.HTTP_200_OK)
 
 
 class OrderHistoryView(generics.ListAPIView):
+    """
+    Lists the user's orders newest first, continuing into archived orders once the recent ones run out. Pass
+    `page_size` and then the returned `next` link to page through them, or `quantity` for just the latest few.
+    """
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_class = OrderFilter
+    pagination_class = OrderKeysetPagination
 
     def get_queryset(self):
-        queryset = Order.objects.filter(user=self.request.user).order_by('-order_date')
+        return orders_of(Order.objects, self.request.user).order_by('-order_date', '-id')
+
+    def filter_queryset(self, queryset):
+        archived = orders_of(ArchivedOrder.objects, self.request.user).order_by('-order_date', '-id')
+        archived = self.filterset_class(self.request.query_params, queryset=archived, request=self.request).qs
+        orders = TieredOrders(super().filter_queryset(queryset), archived)
+
         quantity = int(self.request.query_params.get('quantity', 0))
-        if quantity:
-            queryset = queryset[0:quantity]
+        if quantity and not self.paginator.is_requested(self.request):
+            return orders[0:quantity]
+        return orders
 
-        return queryset
+
+class OrderSummaryView(APIView):
+    """
+    Lifetime order count, spend and last order date of the current user.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        summary = AccountOrderSummary.objects.filter(account=request.user).first()
+        return Response(AccountOrderSummarySerializer(summary or AccountOrderSummary(account=request.user)).data)
+
+
+class TopCustomersView(generics.ListAPIView):
+    """
+    Accounts ranked by lifetime spend, read from the order summaries. `?limit=` caps the list, 10 by default.
+    """
+    serializer_class = AccountOrderSummarySerializer
+    permission_classes = [IsAdmin]
+
+    def get_queryset(self):
+        try:
+            limit = min(max(int(self.request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            limit = 10
+        return AccountOrderSummary.objects.select_related('account').exclude(
+            account__email=ANONYMOUS_EMAIL).order_by('-total_spent')[:limit]
 
 
 class BusinessStatisticsView(APIView):
+    """
+    Sales figures for the admin dashboard, all-time by default. `from` and `to` (YYYY-MM-DD) limit them to a
+    period and, together with `bucket` (day, week or month) and `window`, add a time series of that period.
+    Figures are cached and may be up to STATISTICS_FRESH_SECONDS old, see `as_of`; `?fresh=1` recomputes them.
+    """
     permission_classes = [IsAdmin]
 
     def get(self, request, *args, **kwargs):
-        total_sales = Order.objects.aggregate(total=Sum('total_price'))['total'] or 0
-
-        total_orders = Order.objects.count()
-
-        revenue_by_category = Order.objects.values('item__category').annotate(
-            revenue=Sum('total_price')
-        )
-        revenue_by_category = {item['item__category']: item['revenue'] for item in revenue_by_category}
-
-        average_order_value = Order.objects.aggregate(avg=Avg('total_price'))['avg'] or 0
-
-        top_selling_products = Order.objects.values('item__id', 'item__name').annotate(
-            total_quantity=Sum('quantity')
-        ).order_by('-total_quantity')[:5]
-        top_selling_products = [
-            {'id': item['item__id'], 'name': item['item__name'], 'total_quantity': item['total_quantity']}
-            for item in top_selling_products
-        ]
-
-        data = {
-            'total_sales': total_sales,
-            'total_orders': total_orders,
-            'revenue_by_category': revenue_by_category,
-            'average_order_value': average_order_value,
-            'top_selling_products': top_selling_products,
-        }
-
-        serializer = BusinessStatisticsSerializer(data)
-        return Response(serializer.data)
+        params = request.query_params
+        period = None
+        if any(name in params for name in ('from', 'to', 'bucket', 'window')):
+            try:
+                period = self.parse_period(params)
+            except ValueError as exc:
+                return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        force = params.get('fresh') == '1' and request.user.is_superuser
+        entry = cached_statistics(period, lambda: self.compute(period), force=force)
+        return Response({**entry['data'], 'as_of': entry['as_of']})
+
+    def compute(self, period):
+        if period is None:
+            return dict(BusinessStatisticsSerializer(business_statistics()).data)
+
+        start, end, bucket, window = period
+        data = business_statistics(start, end)
+        data['series'] = timed(data['query_timings'], 'series', lambda: sales_series(start, end, bucket, window))
+        return dict(BusinessStatisticsSerializer(data).data)
+
+    def parse_period(self, params):
+        end = parse_date(params['to']) if params.get('to') else timezone.localdate()
+        if params.get('from'):
+            start = parse_date(params['from'])
+        else:
+            first_day = DailySales.objects.order_by('day').values_list('day', flat=True).first()
+            start = min(first_day, end) if first_day else end
+        if start is None or end is None:
+            raise ValueError('Dates must be in the YYYY-MM-DD format.')
+        if start > end:
+            raise ValueError('from must not be after to.')
+        if (end - start).days >= MAX_SERIES_DAYS:
+            raise ValueError(f'The period can be at most {MAX_SERIES_DAYS} days long.')
+
+        bucket = params.get('bucket', 'day')
+        if bucket not in BUCKETS:
+            raise ValueError(f'Bucket must be one of {", ".join(BUCKETS)}.')
+        window = int(params.get('window', MOVING_AVERAGE_WINDOW))
+        if window < 1:
+            raise ValueError('Window must be at least 1.')
+        return start, end, bucket, window
+
+
+class LiveStatisticsView(APIView):
+    """
+    Approximate figures on live traffic from the streaming sketches: distinct customers today and this month,
+    and the `top` best selling items of the last `minutes`. Purchases not yet folded are included.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            minutes = int(request.query_params.get('minutes', 60))
+            top = int(request.query_params.get('top', 10))
+        except ValueError:
+            return Response({'error': 'minutes and top must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= minutes <= 24 * 60 or not 1 <= top <= SKETCH_TOP_K:
+            return Response({'error': f'minutes must be between 1 and 1440 and top between 1 and {SKETCH_TOP_K}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        sellers = top_items(timezone.now() - timedelta(minutes=minutes), top)
+        names = dict(Item.objects.filter(pk__in=[item_id for item_id, _ in sellers]).values_list('pk', 'name'))
+        return Response({
+            'unique_customers_today': distinct_buyers(start_of_day()),
+            'unique_customers_this_month': distinct_buyers(start_of_month()),
+            'window_minutes': minutes,
+            'top_items': [
+                {'id': item_id, 'name': names.get(item_id), 'estimated_quantity': quantity}
+                for item_id, quantity in sellers
+            ],
+        })
+
+
+class OrderAnalyticsView(APIView):
+    """
+    Price distribution, basket sizes, customer spend and cohorts over the memory-mapped order snapshot
+    written by `manage.py snapshot_orders`. Figures are as of the last snapshot run.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        manifest = read_manifest()
+        if not manifest['segments']:
+            return Response({'error': 'There is no order snapshot yet, run manage.py snapshot_orders.'},
+                            status=status.HTTP_404_NOT_FOUND)
+        try:
+            bins = int(request.query_params.get('bins', 20))
+        except ValueError:
+            bins = 0
+        if not 1 <= bins <= 200:
+            return Response({'error': 'bins must be between 1 and 200.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = order_analytics(load_columns(), bins=bins)
+        data['as_of'] = manifest['updated_at']
+        data['last_order_id'] = manifest['last_order_id']
+        return Response(data)
+
+
+class RetentionView(APIView):
+    """
+    Monthly cohort retention from the incrementally kept cohort counts: for customers whose first order was
+    in a month, how many ordered again 1..`months` months later. `from` (YYYY-MM) skips older cohorts.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        since = None
+        try:
+            months = int(request.query_params.get('months', RETENTION_MONTHS))
+            if request.query_params.get('from'):
+                since = datetime.strptime(request.query_params['from'], '%Y-%m').date()
+        except ValueError:
+            return Response({'error': 'months must be a number and from a YYYY-MM month.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= months <= 120:
+            return Response({'error': 'months must be between 1 and 120.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'months': months, 'cohorts': retention_matrix(since, months)})
 
 
 class CorrectedItemSearchView(APIView):
@@ -130,3 +329,47 @@ class CorrectedItemSearchView(APIView):
         search_results = perform_nlp_search(query)
         serializer = ItemSerializer(search_results, many=True)
         return Response(serializer.data)
+
+
+class ExportView(APIView):
+    """
+    Streams a queryset as CSV (default) or NDJSON (`?output=ndjson`) without loading it into memory.
+    """
+    permission_classes = [IsStaff]
+    queryset = None
+    fields = []
+    filename = 'export'
+
+    def get_rows(self):
+        return self.queryset.all().values(*self.fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'csv')
+        if output not in ('csv', 'ndjson'):
+            return Response({'error': 'Output must be csv or ndjson.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = self.get_rows()
+        if output == 'csv':
+            response = StreamingHttpResponse(csv_stream(rows, self.fields), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(ndjson_stream(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}.{output}"'
+        return response
+
+
+class ItemExportView(ExportView):
+    queryset = Item.objects.with_stock().order_by('pk')
+    fields = ['id', 'category_id', 'category__name', 'name', 'description', 'price', 'stock',
+              'is_with_prescription', 'updated_at']
+    filename = 'items'
+
+
+class OrderExportView(ExportView):
+    queryset = Order.objects.order_by('pk')
+    fields = ['id', 'item_id', 'item__name', 'user_id', 'total_price', 'quantity', 'order_date']
+    filename = 'orders'
+
+    def get_rows(self):
+        # Archived orders are the oldest ones, so streaming them first keeps the export in id order
+        archived = ArchivedOrder.objects.order_by('pk').values(*self.fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        return chain(archived, super().get_rows())
@@ -57,7 +57,7 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -66,6 +66,13 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# Activation links are queued in the email outbox, so they have to stay valid for all of its retries
+ACTIVATION_TOKEN_LIFETIME = timedelta(days=2)
+
+# Resolved accounts of JWT requests are cached per process for this long, for at most this many accounts
+AUTH_USER_CACHE_SECONDS = 30
+AUTH_USER_CACHE_SIZE = 1024
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -103,6 +110,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default, so concurrent tests wait for locks the way the server does
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -143,6 +152,35 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Item images are resized into these renditions by a background worker after upload
+THUMBNAIL_RENDITIONS = {
+    'list': (200, 200),
+    'detail': (800, 800),
+    'retina': (1600, 1600),
+}
+THUMBNAILS_ASYNC = True
+
+# Orders older than this many days are moved to the archive table by the archive_orders command
+ORDER_ARCHIVE_AFTER_DAYS = 365
+
+# Orders are looked up by the email key until this is switched on. Turn it on once the backfill_order_accounts
+# command has linked every existing order to its account, reads then use the integer account key.
+ORDER_READS_BY_ACCOUNT = False
+
+# Business statistics are served from the default cache and refreshed in the background once older than this
+STATISTICS_FRESH_SECONDS = 60
+STATISTICS_REFRESH_ASYNC = True
+
+# The fold_sketches command keeps 5-minute item sketches and daily buyer sketches for this many days
+SKETCH_ITEM_RETENTION_DAYS = 2
+SKETCH_BUYER_RETENTION_DAYS = 62
+
+# Columnar .npy snapshot of all orders written by the snapshot_orders command for ad-hoc analytics
+ORDER_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'analytics')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
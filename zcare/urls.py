@@ -14,12 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 from rest_framework import routers
 from rest_framework_simplejwt import views as jwt_views
 
 from item import views
+from item.idempotency import idempotent
 from core import views as core_views
 
 api_prefix = 'api'
@@ -38,7 +41,16 @@ urlpatterns = [
     path(f'{api_prefix}/logout/', core_views.LogoutUserView.as_view(), name='logout'),
     path(f'{api_prefix}/user/delete/', core_views.DeleteAccountView.as_view(), name='delete-user'),
     path(f'{api_prefix}/user/order_history', views.OrderHistoryView.as_view(), name='order-history'),
-    path(f'{api_prefix}/items/<int:pk>/buy', views.item_buy, name='item-buy'),
+    path(f'{api_prefix}/user/order_summary', views.OrderSummaryView.as_view(), name='order-summary'),
+    path(f'{api_prefix}/items/<int:pk>/buy', idempotent(views.item_buy), name='item-buy'),
+    path(f'{api_prefix}/checkout', idempotent(views.CheckoutView.as_view()), name='checkout'),
+    path(f'{api_prefix}/items/bulk', views.ItemBulkUpsertView.as_view(), name='item-bulk'),
     path(f'{api_prefix}/search/', views.CorrectedItemSearchView.as_view(), name='item-search'),
     path(f'{api_prefix}/business-statistics/', views.BusinessStatisticsView.as_view(), name='business-statistics'),
-]
+    path(f'{api_prefix}/business-statistics/live', views.LiveStatisticsView.as_view(), name='business-statistics-live'),
+    path(f'{api_prefix}/analytics/orders', views.OrderAnalyticsView.as_view(), name='order-analytics'),
+    path(f'{api_prefix}/analytics/top-customers', views.TopCustomersView.as_view(), name='top-customers'),
+    path(f'{api_prefix}/analytics/retention', views.RetentionView.as_view(), name='retention'),
+    path(f'{api_prefix}/export/items', views.ItemExportView.as_view(), name='item-export'),
+    path(f'{api_prefix}/export/orders', views.OrderExportView.as_view(), name='order-export'),
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)